@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+"""
+Start up benchmark for near_queue processors.
+
+Each run is a fresh interpreter, reporting per processor type:
+import: time to import near_queue.processors (after django is set up)
+first entry: from starting the interpreter to the first processor call,
+running retrieve_and_process_files against in-memory fake transports
+process: the whole run, interpreter exit included
+
+The fakes keep the network out of it, but also the import of the
+libraries behind each transport, which lazy loading defers to first use.
+Those are reported separately, each timed in a fresh interpreter: a
+processor pays for the transports it uses on its first entry, and never
+for the others (e.g. an SFTP processor never imports imaplib).
+
+    python benchmarks/startup.py [--runs N]
+"""
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+KINDS = ('sftp', 'imap')
+
+# what using each transport imports, its module and (if lazily imported
+# by it) the library behind it.
+TRANSPORT_IMPORTS = (
+    ('s3', ('near_queue.transports.s3',)),
+    ('sftp', ('near_queue.transports.sftp', 'rowdy.sftp')),
+    ('imap', ('near_queue.transports.imap',)),
+    ('gpg', ('near_queue.transports.gpg',)),
+)
+
+
+class FakeS3(object):
+
+    def __init__(self):
+        self.buckets = {}
+
+    def get_bucket(self, s3_account):
+        return self.buckets.setdefault(s3_account.bucket, {})
+
+    def key_size(self, bucket, name):
+        return len(bucket[name])
+
+    def download(self, bucket, name, fname):
+        with open(fname, 'wb') as f:
+            f.write(bucket[name])
+
+    def upload(self, bucket, name, fname):
+        with open(fname, 'rb') as f:
+            bucket[name] = f.read()
+
+    def list_keys(self, bucket, prefix):
+        return [k for k in bucket if k.startswith(prefix)]
+
+    def list_prefixes(self, bucket, prefix):
+        return sorted(set(prefix + k[len(prefix):].split('/')[0] + '/'
+                          for k in self.list_keys(bucket, prefix)
+                          if '/' in k[len(prefix):]))
+
+
+class FakeSFTPConnection(object):
+
+    def open_connection(self):
+        pass
+
+    def close_connection(self):
+        pass
+
+    def listdir(self, folder):
+        return ['data_0001.csv']
+
+    def get(self, fname, localpath):
+        with open(localpath, 'wb') as f:
+            f.write(b'a,b,c\n1,2,3\n')
+
+    def remove(self, fname):
+        pass
+
+
+class FakeSFTP(object):
+
+    def connect(self, sftp_account):
+        return FakeSFTPConnection()
+
+    def file_size(self, sftp, path):
+        return None
+
+    def list_folder(self, sftp, folder, find_folders=True):
+        return [(name, False) for name in sftp.listdir(folder)]
+
+
+class FakeIMAPAccount(object):
+    hostname = 'imap.example.com'
+    username = 'bench'
+
+    def open_connection(self):
+        pass
+
+    def close_connection(self):
+        pass
+
+    def uid_validity(self, mailbox):
+        return 1
+
+    def list_uids(self, mailbox):
+        return [1]
+
+    def download_attachments(self, mailbox, uid, uid_validity,
+                             filename_regex=None):
+        import datetime
+        fd, fname = tempfile.mkstemp()
+        os.write(fd, b'a,b,c\n1,2,3\n')
+        os.close(fd)
+        return [{'utc_date': datetime.datetime(2014, 1, 1),
+                 'remote_fname': 'data_0001.csv',
+                 'local_fname': fname}]
+
+    def move(self, mailbox, uid, uid_validity, archive_mbox):
+        pass
+
+
+class Account(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def _setup_django(scratch_dir):
+    from django.conf import settings
+    settings.configure(
+        DATABASES={
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': ':memory:',
+            }
+        },
+        INSTALLED_APPS=[
+            'django.contrib.auth',
+            'django.contrib.contenttypes',
+            'near_queue',
+        ],
+        NEAR_QUEUE_SCRATCH_DIR=scratch_dir,
+    )
+    import django
+    if hasattr(django, 'setup'):
+        django.setup()
+    if django.VERSION < (1, 7):
+        from django.core.management import call_command
+        call_command('syncdb', interactive=False, verbosity=0)
+    else:
+        from django.apps import apps
+        from django.db import connection
+        with connection.schema_editor() as editor:
+            for model in apps.get_app_config('near_queue').get_models():
+                editor.create_model(model)
+
+
+def child(kind):
+    _setup_django(tempfile.mkdtemp())
+
+    start = time.time()
+    import near_queue.processors as processors
+    import_time = time.time() - start
+
+    from near_queue import transports
+    transports.register('s3', FakeS3())
+    transports.register('sftp', FakeSFTP())
+
+    first_call = []
+
+    def processor(localpath):
+        if not first_call:
+            first_call.append(time.time())
+
+    common = dict(
+        S3_UPLOAD_QUEUE='bench-upload-' + kind,
+        S3_PROCESS_QUEUE='bench-process-' + kind,
+        S3_DIRECTORY='bench',
+        S3_ACCOUNT=Account(access_key='', secret_key='', host='s3.local',
+                           bucket='bench'),
+        COMPRESS_FILE=False,
+        ENCRYPT_FILE=False,
+        processor=staticmethod(processor),
+    )
+    if kind == 'sftp':
+        base = processors.SFTP_S3_CSV_Processor
+        common.update(
+            SFTP_ACCOUNT=Account(username='bench', password='',
+                                 hostname='sftp.local'),
+            SFTP_FOLDER='incoming',
+            SFTP_FILE_REGEX=r'.*\.csv$',
+            REMOVE_FROM_SFTP=False,
+        )
+    else:
+        base = processors.IMAP_S3_CSV_Processor
+        common.update(
+            IMAP_ACCOUNT=FakeIMAPAccount(),
+            IMAP_MBOX='INBOX',
+            IMAP_FILE_REGEX=r'.*\.csv$',
+            IMAP_ARCHIVE_MBOX=None,
+        )
+    bench = type('Bench', (base,), common)
+    bench.retrieve_and_process_files()
+
+    json.dump({
+        'import': import_time,
+        'first_entry_at': first_call[0] if first_call else None,
+    }, sys.stdout)
+
+
+def import_child(transport):
+    _setup_django(tempfile.mkdtemp())
+    import near_queue.processors  # noqa
+    modules = dict(TRANSPORT_IMPORTS)[transport]
+    start = time.time()
+    try:
+        for module in modules:
+            importlib.import_module(module)
+    except ImportError as e:
+        json.dump({'error': str(e)}, sys.stdout)
+        return
+    json.dump({'import': time.time() - start}, sys.stdout)
+
+
+def _run_child(env, *args):
+    out = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__)] + list(args), env=env)
+    return json.loads(out.decode('utf-8'))
+
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main(runs):
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(
+        p for p in [root, env.get('PYTHONPATH')] if p)
+    print('{0:<6} {1:>14} {2:>14} {3:>14}'.format(
+        'kind', 'import ms', 'first entry ms', 'process ms'))
+    for kind in KINDS:
+        results = []
+        for _ in range(runs):
+            start = time.time()
+            result = _run_child(env, '--child', kind)
+            result['process'] = time.time() - start
+            result['first_entry'] = result['first_entry_at'] - start
+            results.append(result)
+        print('{0:<6} {1:>14.1f} {2:>14.1f} {3:>14.1f}'.format(
+            kind,
+            _median([r['import'] for r in results]) * 1000,
+            _median([r['first_entry'] for r in results]) * 1000,
+            _median([r['process'] for r in results]) * 1000))
+
+    print('')
+    row = '{0:<10} {1:>14}  {2}'
+    print(row.format('transport', 'import ms', 'modules'))
+    for transport, modules in TRANSPORT_IMPORTS:
+        results = [_run_child(env, '--import', transport)
+                   for _ in range(runs)]
+        errors = [r['error'] for r in results if 'error' in r]
+        if errors:
+            timing = 'n/a ({0})'.format(errors[0])
+        else:
+            timing = '{0:.1f}'.format(
+                _median([r['import'] for r in results]) * 1000)
+        print(row.format(transport, timing, ', '.join(modules)))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == '--child':
+        child(sys.argv[2])
+    elif len(sys.argv) == 3 and sys.argv[1] == '--import':
+        import_child(sys.argv[2])
+    else:
+        runs = 5
+        if len(sys.argv) == 3 and sys.argv[1] == '--runs':
+            runs = int(sys.argv[2])
+        main(runs)
@@ -1,15 +1,98 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.core.urlresolvers import reverse
+from django.db import connections
+from django.db.models.query import QuerySet
 
+from .models import PendingCleanup
 from .models import Queue
 from .models import QueueEntry
+from .models import QueueStats
+
+
+class EstimatedCountQuerySet(QuerySet):
+    """
+    count() uses the database's row estimate when unfiltered on a large
+    table, rather than a full table COUNT(*). The changelist counts the
+    unfiltered queryset even when showing a filtered one (for its "N
+    total"), so both go through this.
+    """
+    threshold = 100000
+
+    def _estimate(self):
+        if self.query.where:
+            return None
+        connection = connections[self.db]
+        table = self.model._meta.db_table
+        if connection.vendor == 'postgresql':
+            sql = 'SELECT reltuples FROM pg_class WHERE relname = %s'
+        elif connection.vendor == 'mysql':
+            sql = ('SELECT table_rows FROM information_schema.tables '
+                   'WHERE table_schema = DATABASE() AND table_name = %s')
+        else:
+            return None
+        cursor = connection.cursor()
+        cursor.execute(sql, [table])
+        row = cursor.fetchone()
+        if row is None or row[0] is None or row[0] < self.threshold:
+            return None
+        return int(row[0])
+
+    def count(self):
+        count = self._estimate()
+        if count is None:
+            count = super(EstimatedCountQuerySet, self).count()
+        return count
+
+
+class KnownCountPaginator(Paginator):
+    """A Paginator that can be told its count up front."""
+
+    def __init__(self, *args, **kwargs):
+        self.known_count = kwargs.pop('count', None)
+        super(KnownCountPaginator, self).__init__(*args, **kwargs)
+
+    @property
+    def count(self):
+        if self.known_count is not None:
+            return self.known_count
+        return super(KnownCountPaginator, self).count
+
+
+# changelist parameters that don't filter.
+_NON_FILTER_PARAMS = ('p', 'o', 'all')
+
+
+def _stats_count(request):
+    """
+    Count of the QueueEntry changelist from QueueStats, when it is only
+    filtered by queue (and completeness), None otherwise.
+    """
+    params = dict((k, v) for k, v in request.GET.items()
+                  if k not in _NON_FILTER_PARAMS)
+    queue_id = params.pop('queue__id__exact', None)
+    is_complete = params.pop('is_complete__exact', None)
+    if queue_id is None or params:
+        return None
+    try:
+        stats = QueueStats.objects.get(queue=queue_id)
+    except (QueueStats.DoesNotExist, ValueError):
+        return None
+    if is_complete is None:
+        return stats.pending + stats.completed
+    if is_complete == '1':
+        return stats.completed
+    if is_complete == '0':
+        return stats.pending
+    return None
 
 
 class QueueEntryAdmin(admin.ModelAdmin):
-    date_hierarchy = 'time_completed'
     list_display = (
         'queue',
         'key',
         'sort_key',
+        'partition_key',
         'time_added',
         'is_complete',
         'time_completed',
@@ -21,17 +104,78 @@ class QueueEntryAdmin(admin.ModelAdmin):
     list_editable = (
         'is_complete',
     )
+    list_select_related = True
+    paginator = KnownCountPaginator
 
+    def get_queryset(self, request):
+        qs = super(QueueEntryAdmin, self).get_queryset(request)
+        return qs._clone(klass=EstimatedCountQuerySet)
 
-class QueueEntryInline(admin.TabularInline):
-    model = QueueEntry
+    def get_paginator(self, request, queryset, per_page, orphans=0,
+                      allow_empty_first_page=True):
+        return self.paginator(queryset, per_page, orphans,
+                              allow_empty_first_page,
+                              count=_stats_count(request))
 
 
 class QueueAdmin(admin.ModelAdmin):
+    """
+    Entries are reached through the (paginated) QueueEntry changelist,
+    counted from QueueStats, rather than an inline of every entry.
+    """
     list_display = (
         'name',
+        'entries',
     )
-    inlines = [QueueEntryInline]
+
+    def entries(self, obj):
+        url = reverse('admin:near_queue_queueentry_changelist')
+        return '<a href="{0}?queue__id__exact={1}">entries</a>'.format(
+            url, obj.pk)
+    entries.allow_tags = True
+
+
+class QueueStatsAdmin(admin.ModelAdmin):
+    list_display = (
+        'queue',
+        'pending',
+        'in_flight',
+        'completed',
+        'oldest_pending',
+    )
+    list_select_related = True
+    readonly_fields = (
+        'queue',
+        'pending',
+        'in_flight',
+        'completed',
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+
+class PendingCleanupAdmin(admin.ModelAdmin):
+    list_display = (
+        'kind',
+        'endpoint',
+        'path',
+        'mailbox',
+        'uid',
+        'archive_mbox',
+        'time_added',
+        'attempts',
+        'last_error',
+    )
+    list_filter = (
+        'kind',
+        'endpoint',
+    )
+
+    def has_add_permission(self, request):
+        return False
 
 admin.site.register(QueueEntry, QueueEntryAdmin)
 admin.site.register(Queue, QueueAdmin)
+admin.site.register(QueueStats, QueueStatsAdmin)
+admin.site.register(PendingCleanup, PendingCleanupAdmin)
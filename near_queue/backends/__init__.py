@@ -0,0 +1,51 @@
+"""
+Where queue entries live.
+
+The processors only enqueue, iterate pending entries, claim, release and
+complete them, through a QueueBackend. The Django models are the default
+backend. The SQLite (WAL) and Redis backends take that traffic off the
+main database, optionally mirroring every operation into the models so
+the admin, stats and profiles keep working as an audit trail.
+
+Settings (all optional):
+NEAR_QUEUE_BACKEND = 'near_queue.backends.orm.DjangoBackend'
+NEAR_QUEUE_BACKEND_OPTIONS = {} (keyword arguments for the backend)
+NEAR_QUEUE_BACKEND_MIRROR = True (mirror a non-Django backend to the models)
+"""
+import importlib
+import threading
+
+from near_queue.backends.base import Entry  # noqa
+from near_queue.backends.base import MirroredBackend
+from near_queue.backends.base import QueueBackend  # noqa
+
+
+DEFAULT_BACKEND = 'near_queue.backends.orm.DjangoBackend'
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _import(path):
+    module_path, _, name = path.rpartition('.')
+    return getattr(importlib.import_module(module_path), name)
+
+
+def load_backend(path, options=None, mirror=True):
+    backend = _import(path)(**(options or {}))
+    if mirror and path != DEFAULT_BACKEND:
+        backend = MirroredBackend(backend, _import(DEFAULT_BACKEND)())
+    return backend
+
+
+def get_backend():
+    """The process wide backend, from settings."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            from django.conf import settings
+            _backend = load_backend(
+                getattr(settings, 'NEAR_QUEUE_BACKEND', DEFAULT_BACKEND),
+                getattr(settings, 'NEAR_QUEUE_BACKEND_OPTIONS', None),
+                getattr(settings, 'NEAR_QUEUE_BACKEND_MIRROR', True))
+        return _backend
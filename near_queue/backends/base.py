@@ -0,0 +1,166 @@
+import logging
+import os
+import socket
+import uuid
+
+
+logger = logging.getLogger(__name__.split('.')[0])
+
+
+def worker_id():
+    """A name for the claims of one backend, unique to it."""
+    return '{0}:{1}:{2}'.format(socket.gethostname(), os.getpid(),
+                                uuid.uuid4().hex[:8])
+
+
+class Entry(object):
+    """A queued key, as handed out by QueueBackend.pending."""
+
+    def __init__(self, queue, key, sort_key=None, record=None,
+                 partition=''):
+        self.queue = queue
+        self.key = key
+        self.sort_key = sort_key
+        self.partition = partition
+        # backend specific, e.g. the QueueEntry for the Django backend.
+        self.record = record
+
+    def __str__(self):
+        return '{0}: {1}'.format(self.queue, self.key)
+
+    def __repr__(self):
+        return 'Entry({0!r}, {1!r})'.format(self.queue, self.key)
+
+
+class QueueBackend(object):
+    """
+    Operations the processors need from a queue. Queues are referred to by
+    name and created on first use.
+
+    Each entry belongs to a partition, '' unless given one, and only needs
+    to be processed in order with the rest of its partition.
+
+    A claim is a lease of lease seconds, after which a crashed worker's
+    entry can be claimed again, so it is renewed for as long as the entry
+    is being worked on. Only the backend holding a claim can renew,
+    release or complete it.
+    """
+
+    lease = 3600
+
+    def enqueue(self, queue, keys, sort_key_fn=None, reopen=False,
+                partition_fn=None):
+        """
+        Add keys not already in queue, sort_key_fn(key) giving their
+        sort_key and partition_fn(key) their partition. With reopen, keys
+        already completed are made pending again. Returns the number of
+        keys added.
+        """
+        raise NotImplementedError
+
+    def pending(self, queue, partition=None):
+        """
+        Iterate incomplete Entry's, of just partition unless it is None, by
+        sort_key, time added then key.
+        """
+        raise NotImplementedError
+
+    def partitions(self, queue):
+        """The partitions of queue with incomplete entries."""
+        raise NotImplementedError
+
+    def claim(self, entry):
+        """
+        Mark entry as being worked on, returns False if it is already
+        claimed (by another worker) or complete.
+        """
+        raise NotImplementedError
+
+    def renew(self, entry):
+        """
+        Extend the claim on entry by another lease, returns False if it is
+        no longer claimed.
+        """
+        raise NotImplementedError
+
+    def release(self, entry):
+        """Give up a claim without completing entry."""
+        raise NotImplementedError
+
+    def complete(self, entry):
+        """
+        Mark a claimed entry as complete, returns False (leaving it to
+        whoever has it now) if it is no longer claimed.
+        """
+        raise NotImplementedError
+
+    def keys(self, queue):
+        """Every key in queue, complete or not."""
+        raise NotImplementedError
+
+
+class MirroredBackend(QueueBackend):
+    """
+    Reads from and writes to primary, repeating writes on mirror. Errors
+    from mirror are logged and otherwise ignored.
+    """
+
+    def __init__(self, primary, mirror):
+        self.primary = primary
+        self.mirror = mirror
+
+    @property
+    def lease(self):
+        return self.primary.lease
+
+    def _mirror(self, method, *args, **kwargs):
+        try:
+            getattr(self.mirror, method)(*args, **kwargs)
+        except Exception:
+            logger.exception('mirroring {0} failed'.format(method))
+
+    def enqueue(self, queue, keys, sort_key_fn=None, reopen=False,
+                partition_fn=None):
+        keys = list(keys)
+        added = self.primary.enqueue(queue, keys, sort_key_fn, reopen,
+                                     partition_fn)
+        self._mirror('enqueue', queue, keys, sort_key_fn, reopen,
+                     partition_fn)
+        return added
+
+    def pending(self, queue, partition=None):
+        return self.primary.pending(queue, partition)
+
+    def partitions(self, queue):
+        return self.primary.partitions(queue)
+
+    @staticmethod
+    def _detached(entry):
+        # without primary's record, for mirror to look up its own.
+        return Entry(entry.queue, entry.key, entry.sort_key,
+                     partition=entry.partition)
+
+    def claim(self, entry):
+        claimed = self.primary.claim(entry)
+        if claimed:
+            self._mirror('claim', self._detached(entry))
+        return claimed
+
+    def renew(self, entry):
+        renewed = self.primary.renew(entry)
+        if renewed:
+            self._mirror('renew', self._detached(entry))
+        return renewed
+
+    def release(self, entry):
+        self.primary.release(entry)
+        self._mirror('release', self._detached(entry))
+
+    def complete(self, entry):
+        completed = self.primary.complete(entry)
+        if completed:
+            self._mirror('complete', self._detached(entry))
+        return completed
+
+    def keys(self, queue):
+        return self.primary.keys(queue)
@@ -0,0 +1,140 @@
+import datetime
+import logging
+
+from django.db import IntegrityError
+from django.db import transaction
+
+from near_queue.backends.base import Entry
+from near_queue.backends.base import QueueBackend
+from near_queue.backends.base import worker_id
+from near_queue.models import Queue
+from near_queue.models import QueueEntry
+from near_queue.models import QueueStats
+
+
+logger = logging.getLogger(__name__.split('.')[0])
+
+
+class DjangoBackend(QueueBackend):
+    """Queues as Queue/QueueEntry rows, the default backend."""
+
+    def __init__(self, batch_size=500, lease=3600):
+        self.batch_size = batch_size
+        self.lease = lease
+        self.worker = worker_id()
+        self._queues = {}
+
+    def _queue(self, name):
+        if name not in self._queues:
+            self._queues[name], _ = Queue.objects.get_or_create(name=name)
+        return self._queues[name]
+
+    def enqueue(self, queue, keys, sort_key_fn=None, reopen=False,
+                partition_fn=None):
+        q = self._queue(queue)
+        added = 0
+        seen = set()
+        keys = [k for k in keys if not (k in seen or seen.add(k))]
+        for i in range(0, len(keys), self.batch_size):
+            batch = keys[i:i + self.batch_size]
+            existing = QueueEntry.objects.filter(queue=q, key__in=batch)
+            if reopen:
+                completed = existing.filter(is_complete=True)
+                reopened = completed.update(is_complete=False)
+                # update() skips QueueEntry.save, so count them ourselves.
+                QueueStats.record_reopened(q.pk, reopened)
+            existing = set(existing.values_list('key', flat=True))
+            new = [QueueEntry(queue=q, key=key,
+                              sort_key=sort_key_fn(key) if sort_key_fn
+                              else None,
+                              partition_key=(partition_fn(key) or '')
+                              if partition_fn else '')
+                   for key in batch if key not in existing]
+            new = self._create(q, new)
+            for qe in new:
+                logger.info('queued: {0}'.format(qe))
+            if existing:
+                logger.info('already in queue: {0} entries'.format(
+                    len(existing)))
+            added += len(new)
+        return added
+
+    def _pending(self, queue):
+        return QueueEntry.objects.filter(queue=self._queue(queue),
+                                         is_complete=False)
+
+    def _create(self, q, new):
+        """Insert new entries, returns those that weren't there already."""
+        try:
+            with transaction.atomic():
+                QueueEntry.objects.bulk_create(new)
+        except IntegrityError:
+            # another worker queued some of them since we looked, fall back
+            # to one at a time (save() counts those it creates).
+            return [qe for qe in new if QueueEntry.objects.get_or_create(
+                queue=q, key=qe.key,
+                defaults={'sort_key': qe.sort_key,
+                          'partition_key': qe.partition_key})[1]]
+        # bulk_create skips QueueEntry.save, so count them ourselves.
+        QueueStats.record_added(q.pk, len(new))
+        return new
+
+    def pending(self, queue, partition=None):
+        entries = self._pending(queue)
+        if partition is not None:
+            entries = entries.filter(partition_key=partition)
+        for qe in entries.iterator():
+            yield Entry(queue, qe.key, qe.sort_key, record=qe,
+                        partition=qe.partition_key)
+
+    def partitions(self, queue):
+        partitions = self._pending(queue).order_by('partition_key')
+        return list(partitions.values_list('partition_key',
+                                           flat=True).distinct())
+
+    def _entry(self, entry):
+        return QueueEntry.objects.filter(queue=self._queue(entry.queue),
+                                         key=entry.key, is_complete=False)
+
+    def _lease_until(self):
+        return datetime.datetime.utcnow() + datetime.timedelta(
+            seconds=self.lease)
+
+    def _claimed(self, entry):
+        return self._entry(entry).filter(claimed_by=self.worker)
+
+    def claim(self, entry):
+        now = datetime.datetime.utcnow()
+        entries = self._entry(entry)
+        if entries.filter(claimed_until__isnull=True).update(
+                claimed_until=self._lease_until(), claimed_by=self.worker):
+            QueueStats.record_in_flight(self._queue(entry.queue).pk, 1)
+            return True
+        # taking over a crashed worker's lease, it's in flight already.
+        return bool(entries.filter(claimed_until__lt=now).update(
+            claimed_until=self._lease_until(), claimed_by=self.worker))
+
+    def renew(self, entry):
+        return bool(self._claimed(entry).update(
+            claimed_until=self._lease_until()))
+
+    def release(self, entry):
+        if self._claimed(entry).update(claimed_until=None, claimed_by=''):
+            QueueStats.record_in_flight(self._queue(entry.queue).pk, -1)
+
+    def complete(self, entry):
+        now = datetime.datetime.utcnow()
+        # update() skips QueueEntry.save, so count it ourselves.
+        if not self._claimed(entry).update(is_complete=True,
+                                           time_completed=now,
+                                           claimed_until=None,
+                                           claimed_by=''):
+            return False
+        queue_id = self._queue(entry.queue).pk
+        QueueStats.record_completed(queue_id, 1, now)
+        QueueStats.record_in_flight(queue_id, -1)
+        return True
+
+    def keys(self, queue):
+        keys = QueueEntry.objects.filter(queue=self._queue(queue))
+        return keys.values_list('key', flat=True).iterator()
@@ -0,0 +1,215 @@
+from __future__ import absolute_import
+
+import json
+import time
+
+from near_queue.backends.base import Entry
+from near_queue.backends.base import QueueBackend
+from near_queue.backends.base import worker_id
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+# claim, atomically: only entries that are there and not complete, and only
+# if nobody else has.
+CLAIM = """
+local state = redis.call('HGET', KEYS[1], ARGV[1])
+if not state or cjson.decode(state)['is_complete'] then
+    return 0
+end
+if redis.call('SET', KEYS[2], ARGV[2], 'NX', 'EX', ARGV[3]) then
+    return 1
+end
+return 0
+"""
+
+# renew a claim this worker still holds.
+RENEW = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# release a claim this worker still holds.
+RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# complete an entry this worker still has claimed: store its new state,
+# take it out of pending and its partition, and drop the claim.
+COMPLETE = """
+if redis.call('GET', KEYS[4]) ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[2], ARGV[3])
+redis.call('ZREM', KEYS[2], ARGV[4])
+redis.call('ZREM', KEYS[3], ARGV[4])
+redis.call('DEL', KEYS[4])
+return 1
+"""
+
+
+class RedisBackend(QueueBackend):
+    """
+    Queues in Redis (or anything speaking its protocol), needs redis-py 3+.
+
+    Per queue, under prefix:queue:
+    entries: hash of key to its JSON state
+    pending: sorted set of 'sort_key NUL time_added NUL key', all scored 0
+    so that it iterates lexicographically, i.e. in sort_key order
+    partition:<partition>: the same, for just that partition's entries
+    partitions: set of every partition used
+    claim:<key>: a lease, held by the worker that set it and expiring after
+    lease seconds; set by a script checking entries, so a completed entry
+    is never claimed
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='near_queue',
+                 lease=3600, batch_size=500, client=None):
+        if client is None:
+            if redis is None:
+                raise ImportError('RedisBackend needs the redis package')
+            client = redis.StrictRedis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self.lease = lease
+        self.batch_size = batch_size
+        self.worker = worker_id()
+        self._claim = client.register_script(CLAIM)
+        self._renew = client.register_script(RENEW)
+        self._release = client.register_script(RELEASE)
+        self._complete = client.register_script(COMPLETE)
+
+    def _name(self, queue, *parts):
+        return ':'.join((self.prefix, queue) + parts)
+
+    @staticmethod
+    def _member(key, sort_key, time_added):
+        # sort_key, then time added, then key, like the other backends.
+        return u'{0}\0{1:017.6f}\0{2}'.format(
+            sort_key or u'', time_added, key)
+
+    def _add_pending(self, pipe, queue, key, state):
+        member = self._member(key, state['sort_key'], state['time_added'])
+        partition = state.get('partition', '')
+        pipe.zadd(self._name(queue, 'pending'), {member: 0})
+        pipe.zadd(self._name(queue, 'partition', partition), {member: 0})
+        pipe.sadd(self._name(queue, 'partitions'), partition)
+
+    def enqueue(self, queue, keys, sort_key_fn=None, reopen=False,
+                partition_fn=None):
+        keys = list(keys)
+        entries = self._name(queue, 'entries')
+        now = time.time()
+        added = 0
+        for i in range(0, len(keys), self.batch_size):
+            batch = keys[i:i + self.batch_size]
+            states = {}
+            pipe = self.client.pipeline()
+            for key in batch:
+                states[key] = {
+                    'sort_key': sort_key_fn(key) if sort_key_fn else None,
+                    'partition': ((partition_fn(key) or '')
+                                  if partition_fn else ''),
+                    'time_added': now,
+                    'is_complete': False,
+                }
+                pipe.hsetnx(entries, key, json.dumps(states[key]))
+            created = pipe.execute()
+
+            pipe = self.client.pipeline()
+            new = [key for key, was_set in zip(batch, created) if was_set]
+            for key in new:
+                self._add_pending(pipe, queue, key, states[key])
+            if reopen:
+                existing = [key for key, was_set in zip(batch, created)
+                            if not was_set]
+                if existing:
+                    current = self.client.hmget(entries, existing)
+                    for key, raw in zip(existing, current):
+                        state = json.loads(raw)
+                        if not state['is_complete']:
+                            continue
+                        state['is_complete'] = False
+                        pipe.hset(entries, key, json.dumps(state))
+                        self._add_pending(pipe, queue, key, state)
+            pipe.execute()
+            added += len(new)
+        return added
+
+    def pending(self, queue, partition=None):
+        if partition is None:
+            pending = self._name(queue, 'pending')
+        else:
+            pending = self._name(queue, 'partition', partition)
+        start = '-'
+        while True:
+            members = self.client.zrangebylex(pending, start, '+', 0,
+                                              self.batch_size)
+            if not members:
+                break
+            parsed = [member.decode('utf-8').split(u'\0', 2)
+                      for member in members]
+            if partition is None:
+                states = self.client.hmget(self._name(queue, 'entries'),
+                                           [key for _, _, key in parsed])
+                partitions = [json.loads(state).get('partition', '')
+                              for state in states]
+            else:
+                partitions = [partition] * len(parsed)
+            for (sort_key, _, key), in_partition in zip(parsed, partitions):
+                yield Entry(queue, key, sort_key or None,
+                            partition=in_partition)
+            start = b'(' + members[-1]
+
+    def partitions(self, queue):
+        partitions = sorted(p.decode('utf-8') for p in self.client.smembers(
+            self._name(queue, 'partitions')))
+        pipe = self.client.pipeline()
+        for partition in partitions:
+            pipe.zcard(self._name(queue, 'partition', partition))
+        return [partition for partition, pending
+                in zip(partitions, pipe.execute()) if pending]
+
+    def claim(self, entry):
+        return bool(self._claim(
+            keys=[self._name(entry.queue, 'entries'),
+                  self._name(entry.queue, 'claim', entry.key)],
+            args=[entry.key, self.worker, self.lease]))
+
+    def renew(self, entry):
+        return bool(self._renew(
+            keys=[self._name(entry.queue, 'claim', entry.key)],
+            args=[self.worker, self.lease]))
+
+    def release(self, entry):
+        self._release(keys=[self._name(entry.queue, 'claim', entry.key)],
+                      args=[self.worker])
+
+    def complete(self, entry):
+        entries = self._name(entry.queue, 'entries')
+        raw = self.client.hget(entries, entry.key)
+        if raw is None:
+            return False
+        state = json.loads(raw)
+        state['is_complete'] = True
+        state['time_completed'] = time.time()
+        member = self._member(entry.key, state['sort_key'],
+                              state['time_added'])
+        return bool(self._complete(
+            keys=[entries, self._name(entry.queue, 'pending'),
+                  self._name(entry.queue, 'partition',
+                             state.get('partition', '')),
+                  self._name(entry.queue, 'claim', entry.key)],
+            args=[self.worker, entry.key, json.dumps(state), member]))
+
+    def keys(self, queue):
+        return [key.decode('utf-8') for key in
+                self.client.hkeys(self._name(queue, 'entries'))]
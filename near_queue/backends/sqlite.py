@@ -0,0 +1,180 @@
+import os
+import sqlite3
+import threading
+import time
+
+from near_queue.backends.base import Entry
+from near_queue.backends.base import QueueBackend
+from near_queue.backends.base import worker_id
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    queue TEXT NOT NULL,
+    key TEXT NOT NULL,
+    sort_key TEXT,
+    partition_key TEXT NOT NULL DEFAULT '',
+    is_complete INTEGER NOT NULL DEFAULT 0,
+    claimed_until REAL,
+    claimed_by TEXT,
+    time_added REAL NOT NULL,
+    time_completed REAL,
+    PRIMARY KEY (queue, key)
+);
+'''
+
+# created after any columns missing from an older database are added.
+INDEXES = '''
+CREATE INDEX IF NOT EXISTS entries_pending
+    ON entries (queue, is_complete, sort_key, time_added, key);
+CREATE INDEX IF NOT EXISTS entries_partition_pending
+    ON entries (queue, is_complete, partition_key, sort_key, time_added, key);
+'''
+
+
+class SQLiteBackend(QueueBackend):
+    """
+    Queues in a local SQLite database in WAL mode, so readers don't block
+    the writer and commits are cheap. Shared by every process on the host
+    that points at the same path.
+    """
+
+    def __init__(self, path, lease=3600, batch_size=500):
+        self.path = path
+        self.lease = lease
+        self.batch_size = batch_size
+        self.worker = worker_id()
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+            columns = [row[1] for row in
+                       conn.execute('PRAGMA table_info(entries)')]
+            if 'partition_key' not in columns:
+                conn.execute("ALTER TABLE entries ADD COLUMN "
+                             "partition_key TEXT NOT NULL DEFAULT ''")
+            if 'claimed_by' not in columns:
+                conn.execute('ALTER TABLE entries ADD COLUMN claimed_by TEXT')
+            conn.executescript(INDEXES)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _connection(self):
+        """This thread's connection, usable as a transaction context."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def enqueue(self, queue, keys, sort_key_fn=None, reopen=False,
+                partition_fn=None):
+        keys = list(keys)
+        now = time.time()
+        added = 0
+        conn = self._connection()
+        for i in range(0, len(keys), self.batch_size):
+            batch = keys[i:i + self.batch_size]
+            rows = [(queue, key, sort_key_fn(key) if sort_key_fn else None,
+                     (partition_fn(key) or '') if partition_fn else '', now)
+                    for key in batch]
+            with conn:
+                before = conn.total_changes
+                conn.executemany(
+                    'INSERT OR IGNORE INTO entries '
+                    '(queue, key, sort_key, partition_key, time_added) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    rows)
+                added += conn.total_changes - before
+                if reopen:
+                    conn.executemany(
+                        'UPDATE entries SET is_complete = 0 '
+                        'WHERE queue = ? AND key = ? AND is_complete = 1',
+                        [(queue, key) for key in batch])
+        return added
+
+    @staticmethod
+    def _after(sort_key, time_added, key):
+        """Condition for entries after this one (NULL sort_keys first)."""
+        tie = '(time_added > ? OR (time_added = ? AND key > ?))'
+        if sort_key is None:
+            return ('(sort_key IS NOT NULL OR (sort_key IS NULL AND {0}))'
+                    .format(tie), (time_added, time_added, key))
+        return ('(sort_key > ? OR (sort_key = ? AND {0}))'.format(tie),
+                (sort_key, sort_key, time_added, time_added, key))
+
+    def pending(self, queue, partition=None):
+        where = 'queue = ? AND is_complete = 0'
+        params = (queue,)
+        if partition is not None:
+            where += ' AND partition_key = ?'
+            params += (partition,)
+        last = None
+        while True:
+            sql, args = where, params
+            if last is not None:
+                after, after_params = self._after(*last)
+                sql += ' AND ' + after
+                args += after_params
+            # a batch at a time, rather than holding a read open (and so
+            # holding up WAL checkpoints) while the entries are processed.
+            rows = self._connection().execute(
+                'SELECT key, sort_key, partition_key, time_added '
+                'FROM entries WHERE {0} '
+                'ORDER BY sort_key, time_added, key LIMIT ?'.format(sql),
+                args + (self.batch_size,)).fetchall()
+            for key, sort_key, partition_key, _ in rows:
+                yield Entry(queue, key, sort_key, partition=partition_key)
+            if len(rows) < self.batch_size:
+                break
+            key, sort_key, _, time_added = rows[-1]
+            last = (sort_key, time_added, key)
+
+    def partitions(self, queue):
+        cursor = self._connection().execute(
+            'SELECT DISTINCT partition_key FROM entries '
+            'WHERE queue = ? AND is_complete = 0 ORDER BY partition_key',
+            (queue,))
+        return [partition for partition, in cursor]
+
+    def claim(self, entry):
+        now = time.time()
+        with self._connection() as conn:
+            cursor = conn.execute(
+                'UPDATE entries SET claimed_until = ?, claimed_by = ? '
+                'WHERE queue = ? AND key = ? AND is_complete = 0 '
+                'AND (claimed_until IS NULL OR claimed_until < ?)',
+                (now + self.lease, self.worker, entry.queue, entry.key, now))
+            return cursor.rowcount == 1
+
+    def _update_claimed(self, entry, assignments, params):
+        """Update entry if this backend has it claimed."""
+        with self._connection() as conn:
+            cursor = conn.execute(
+                'UPDATE entries SET {0} WHERE queue = ? AND key = ? '
+                'AND is_complete = 0 AND claimed_by = ?'.format(assignments),
+                params + (entry.queue, entry.key, self.worker))
+            return cursor.rowcount == 1
+
+    def renew(self, entry):
+        return self._update_claimed(entry, 'claimed_until = ?',
+                                    (time.time() + self.lease,))
+
+    def release(self, entry):
+        self._update_claimed(entry,
+                             'claimed_until = NULL, claimed_by = NULL', ())
+
+    def complete(self, entry):
+        return self._update_claimed(
+            entry, 'is_complete = 1, time_completed = ?, '
+            'claimed_until = NULL, claimed_by = NULL', (time.time(),))
+
+    def keys(self, queue):
+        cursor = self._connection().execute(
+            'SELECT key FROM entries WHERE queue = ?', (queue,))
+        return [key for key, in cursor]
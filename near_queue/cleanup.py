@@ -0,0 +1,139 @@
+"""
+Remove sources once they are on S3, in bulk.
+
+Rather than reconnecting to delete each SFTP file or archive each email as
+it is uploaded, the upload stage records a PendingCleanup which
+apply_cleanups works through afterwards: SFTP removes over one session per
+account, IMAP moves a UID set per mailbox at a time (see
+near_queue.transports.imap.move_messages). Anything that fails is left
+recorded, with its error, and retried on the next run.
+"""
+import collections
+import errno
+import logging
+
+from django.db.models import F
+
+from near_queue.models import PendingCleanup
+from near_queue.processors import _imap_call
+from near_queue.processors import _sftp_call
+from near_queue.retry import endpoint_name
+from near_queue.retry import is_transient
+from near_queue.transports import get_transport
+
+
+logger = logging.getLogger(__name__.split('.')[0])
+
+BATCH_SIZE = 500
+
+
+def _by_endpoint(scheme, accounts):
+    accounts_by_endpoint = collections.OrderedDict()
+    for account in accounts:
+        accounts_by_endpoint.setdefault(endpoint_name(scheme, account),
+                                        account)
+    return accounts_by_endpoint.items()
+
+
+def _batches(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _done(cleanups):
+    PendingCleanup.objects.filter(pk__in=[c.pk for c in cleanups]).delete()
+
+
+def _failed(cleanups, error):
+    PendingCleanup.objects.filter(pk__in=[c.pk for c in cleanups]).update(
+        attempts=F('attempts') + 1, last_error=repr(error))
+
+
+def apply_cleanups(sftp_accounts=(), imap_accounts=(), batch_size=BATCH_SIZE):
+    """Apply what is recorded for each of the accounts."""
+    for endpoint, account in _by_endpoint('sftp', sftp_accounts):
+        remove_sftp_files(account, endpoint, batch_size)
+    for endpoint, account in _by_endpoint('imap', imap_accounts):
+        move_imap_messages(account, endpoint, batch_size)
+
+
+def remove_sftp_files(sftp_account, endpoint, batch_size=BATCH_SIZE):
+    """
+    Remove the recorded files on one connection, settling each batch as it
+    goes so a reconnect (after a transient error) carries on from there.
+    """
+    remaining = _batches(list(PendingCleanup.objects.filter(
+        kind=PendingCleanup.SFTP_REMOVE, endpoint=endpoint)), batch_size)
+
+    def remove(sftp):
+        while remaining:
+            batch, failed = remaining[0], []
+            for cleanup in batch:
+                try:
+                    sftp.remove(cleanup.path)
+                except (IOError, OSError) as e:
+                    if e.errno == errno.ENOENT:
+                        # removed already, e.g. before a reconnect.
+                        continue
+                    if is_transient(e):
+                        raise
+                    logger.warning('cannot remove {0}: {1!r}'.format(
+                        cleanup, e))
+                    failed.append(cleanup)
+                    _failed([cleanup], e)
+            _done([c for c in batch if c not in failed])
+            logger.info('removed {0} files from {1}'.format(
+                len(batch) - len(failed), endpoint))
+            remaining.pop(0)
+
+    if not remaining:
+        return
+    try:
+        _sftp_call(sftp_account, remove)
+    except Exception as e:
+        logger.exception('leaving files on {0} for next time'.format(
+            endpoint))
+        _failed([c for batch in remaining for c in batch], e)
+
+
+def move_imap_messages(imap_account, endpoint, batch_size=BATCH_SIZE):
+    """
+    Archive the recorded messages on one connection, a batch of UIDs from
+    one mailbox at a time.
+    """
+    groups = collections.OrderedDict()
+    for cleanup in PendingCleanup.objects.filter(
+            kind=PendingCleanup.IMAP_MOVE, endpoint=endpoint):
+        groups.setdefault((cleanup.mailbox, cleanup.uid_validity,
+                           cleanup.archive_mbox), []).append(cleanup)
+    remaining = [(group, batch) for group, cleanups in groups.items()
+                 for batch in _batches(cleanups, batch_size)]
+    imap_transport = get_transport('imap')
+
+    def move(imap):
+        while remaining:
+            (mailbox, uid_validity, archive_mbox), batch = remaining[0]
+            try:
+                imap_transport.move_messages(imap, mailbox,
+                                             [c.uid for c in batch],
+                                             uid_validity, archive_mbox)
+            except Exception as e:
+                if is_transient(e):
+                    raise
+                logger.warning('cannot move {0} messages from {1} to {2}: '
+                               '{3!r}'.format(len(batch), mailbox,
+                                              archive_mbox, e))
+                _failed(batch, e)
+            else:
+                _done(batch)
+                logger.info('moved {0} messages from {1} to {2}'.format(
+                    len(batch), mailbox, archive_mbox))
+            remaining.pop(0)
+
+    if not remaining:
+        return
+    try:
+        _imap_call(imap_account, move)
+    except Exception as e:
+        logger.exception('leaving messages on {0} for next time'.format(
+            endpoint))
+        _failed([c for _, batch in remaining for c in batch], e)
@@ -0,0 +1,100 @@
+"""
+How uploaded files are laid out under S3_DIRECTORY.
+
+flat: S3_DIRECTORY/name (the original layout)
+date: S3_DIRECTORY/YYYY/MM/DD/name
+hash: S3_DIRECTORY/xx/name, xx being the start of md5(name)
+
+Partitioned layouts let a queue rebuild list many small prefixes in
+parallel rather than one huge one. Those prefixes don't include the
+top of S3_DIRECTORY, so after switching a processor from flat to date or
+hash its older files are not seen by a rebuild; move them into the new
+layout, or rebuild once more with the flat layout.
+"""
+import datetime
+import hashlib
+import os
+
+from near_queue.transports import get_transport
+
+try:
+    string_types = basestring  # noqa
+except NameError:
+    string_types = str
+
+
+def _directory_prefix(s3_directory):
+    return s3_directory.rstrip('/') + '/'
+
+
+class FlatLayout(object):
+
+    def key(self, s3_directory, name, when=None):
+        return os.path.join(s3_directory, name)
+
+    def prefixes(self, bucket, s3_directory, since=None):
+        return [_directory_prefix(s3_directory)]
+
+    def sort_key(self, key):
+        return key
+
+
+class DateLayout(FlatLayout):
+
+    def key(self, s3_directory, name, when=None):
+        if when is None:
+            when = datetime.datetime.utcnow()
+        return os.path.join(s3_directory, when.strftime('%Y/%m/%d'), name)
+
+    def prefixes(self, bucket, s3_directory, since=None):
+        """
+        One prefix per day, from since (a date) up to today, or when since
+        is None one per month of every year found in the bucket: a single
+        listing, leaving the rest to be listed concurrently.
+        """
+        root = _directory_prefix(s3_directory)
+        if since is not None:
+            today = datetime.datetime.utcnow().date()
+            days = (today - since).days + 1
+            return [root + (since + datetime.timedelta(days=n)).strftime(
+                '%Y/%m/%d/') for n in range(max(days, 0))]
+        years = get_transport('s3').list_prefixes(bucket, root)
+        return ['{0}{1:02d}/'.format(year, month)
+                for year in years for month in range(1, 13)]
+
+
+class HashLayout(FlatLayout):
+
+    def __init__(self, width=2):
+        self.width = width
+
+    def _shard(self, name):
+        return hashlib.md5(name.encode('utf-8')).hexdigest()[:self.width]
+
+    def key(self, s3_directory, name, when=None):
+        return os.path.join(s3_directory, self._shard(name), name)
+
+    def prefixes(self, bucket, s3_directory, since=None):
+        root = _directory_prefix(s3_directory)
+        return [root + '{0:0{1}x}/'.format(n, self.width)
+                for n in range(16 ** self.width)]
+
+    def sort_key(self, key):
+        # shards are in hash order, keep processing in name order.
+        return os.path.basename(key)
+
+
+LAYOUTS = {
+    'flat': FlatLayout,
+    'date': DateLayout,
+    'hash': HashLayout,
+}
+
+
+def get_key_layout(layout):
+    """layout may be None (flat), a name from LAYOUTS or a layout object."""
+    if layout is None:
+        return FlatLayout()
+    if isinstance(layout, string_types):
+        return LAYOUTS[layout]()
+    return layout
@@ -0,0 +1,72 @@
+import datetime
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db.models import Avg
+from django.db.models import Count
+from django.db.models import Max
+from django.db.models import Sum
+
+from near_queue.models import EntryProfile
+
+
+GROUPINGS = {
+    'queue': ('queue__name',),
+    'key': ('queue__name', 'key'),
+    'processor': ('processor',),
+}
+
+
+class Command(BaseCommand):
+    help = 'Rank queues, keys or processors by time spent in processor.'
+    option_list = BaseCommand.option_list + (
+        make_option('--by', dest='by', default='queue',
+                    help='queue, key or processor (default queue).'),
+        make_option('--order', dest='order', default='total',
+                    help='total, avg or max duration (default total).'),
+        make_option('--days', dest='days', type='int', default=None,
+                    help='Only calls from the last N days.'),
+        make_option('--limit', dest='limit', type='int', default=20),
+        make_option('--failed', dest='failed', action='store_true',
+                    default=False,
+                    help='Only calls where the processor raised.'),
+    )
+
+    def handle(self, *args, **options):
+        if options['by'] not in GROUPINGS:
+            raise CommandError('--by must be one of {0}'.format(
+                ', '.join(sorted(GROUPINGS))))
+        if options['order'] not in ('total', 'avg', 'max'):
+            raise CommandError('--order must be total, avg or max')
+        fields = GROUPINGS[options['by']]
+        profiles = EntryProfile.objects.all()
+        if options['days'] is not None:
+            since = datetime.datetime.utcnow() - datetime.timedelta(
+                days=options['days'])
+            profiles = profiles.filter(time_started__gte=since)
+        if options['failed']:
+            profiles = profiles.filter(failed=True)
+        rows = profiles.values(*fields).annotate(
+            calls=Count('id'),
+            total=Sum('duration'),
+            avg=Avg('duration'),
+            max=Max('duration'),
+            input_bytes=Sum('input_bytes'),
+            rows=Sum('rows'),
+            peak_memory=Max('peak_memory'),
+        ).order_by('-' + options['order'])[:options['limit']]
+
+        self.stdout.write('{0:>8} {1:>10} {2:>9} {3:>9} {4:>12} {5:>10} '
+                          '{6:>12}  {7}'.format('calls', 'total s', 'avg s',
+                                                'max s', 'bytes', 'rows',
+                                                'peak mem', options['by']))
+        for row in rows:
+            self.stdout.write(
+                '{0:>8} {1:>10.1f} {2:>9.2f} {3:>9.2f} {4:>12} {5:>10} '
+                '{6:>12}  {7}'.format(
+                    row['calls'], row['total'], row['avg'], row['max'],
+                    row['input_bytes'] or '-', row['rows'] or '-',
+                    row['peak_memory'] or '-',
+                    ' '.join(str(row[f]) for f in fields)))
@@ -0,0 +1,42 @@
+import datetime
+import importlib
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+
+class Command(BaseCommand):
+    args = '<processor class path>'
+    help = ('Queue every file under a processor\'s S3_DIRECTORY that is '
+            'missing from its S3_PROCESS_QUEUE.')
+    option_list = BaseCommand.option_list + (
+        make_option('--since', dest='since', default=None,
+                    help='YYYY-MM-DD, only list days from this on '
+                         '(date layout).'),
+        make_option('--workers', dest='workers', type='int', default=8,
+                    help='Prefixes listed concurrently.'),
+        make_option('--dry-run', dest='dry_run', action='store_true',
+                    default=False,
+                    help='Report missing keys without queueing them.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: {0}'.format(self.args))
+        module_path, _, name = args[0].rpartition('.')
+        try:
+            processor = getattr(importlib.import_module(module_path), name)
+        except (ImportError, AttributeError, ValueError) as e:
+            raise CommandError('Cannot import {0}: {1}'.format(args[0], e))
+        since = options['since']
+        if since is not None:
+            since = datetime.datetime.strptime(since, '%Y-%m-%d').date()
+        missing = processor.rebuild_process_queue(since=since,
+                                                  workers=options['workers'],
+                                                  dry_run=options['dry_run'])
+        for key in missing:
+            self.stdout.write(key)
+        self.stdout.write('{0} missing from {1}'.format(
+            len(missing), processor.S3_PROCESS_QUEUE))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from near_queue.models import Queue
+from near_queue.models import QueueStats
+
+
+class Command(BaseCommand):
+    args = '[queue_name ...]'
+    help = 'Recount QueueStats from QueueEntry rows (all queues by default).'
+
+    def handle(self, *args, **options):
+        queues = Queue.objects.all()
+        if args:
+            queues = queues.filter(name__in=args)
+        for queue in queues:
+            stats = QueueStats.rebuild(queue)
+            self.stdout.write('{0}: {1} pending, {2} completed'.format(
+                queue, stats.pending, stats.completed))
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'QueueStats'
+        db.create_table(u'near_queue_queuestats', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('queue', self.gf('django.db.models.fields.related.OneToOneField')(related_name='stats', unique=True, to=orm['near_queue.Queue'])),
+            ('pending', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('in_flight', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('completed', self.gf('django.db.models.fields.IntegerField')(default=0)),
+        ))
+        db.send_create_signal(u'near_queue', ['QueueStats'])
+
+        # Adding model 'QueueThroughput'
+        db.create_table(u'near_queue_queuethroughput', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('queue', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['near_queue.Queue'])),
+            ('hour', self.gf('django.db.models.fields.DateTimeField')()),
+            ('completed', self.gf('django.db.models.fields.IntegerField')(default=0)),
+        ))
+        db.send_create_signal(u'near_queue', ['QueueThroughput'])
+
+        # Adding unique constraint on 'QueueThroughput', fields ['queue', 'hour']
+        db.create_unique(u'near_queue_queuethroughput', ['queue_id', 'hour'])
+
+        # Adding index on 'QueueEntry', fields ['queue', 'is_complete', 'time_added']
+        db.create_index(u'near_queue_queueentry', ['queue_id', 'is_complete', 'time_added'])
+
+
+    def backwards(self, orm):
+        # Removing index on 'QueueEntry', fields ['queue', 'is_complete', 'time_added']
+        db.delete_index(u'near_queue_queueentry', ['queue_id', 'is_complete', 'time_added'])
+
+        # Removing unique constraint on 'QueueThroughput', fields ['queue', 'hour']
+        db.delete_unique(u'near_queue_queuethroughput', ['queue_id', 'hour'])
+
+        # Deleting model 'QueueStats'
+        db.delete_table(u'near_queue_queuestats')
+
+        # Deleting model 'QueueThroughput'
+        db.delete_table(u'near_queue_queuethroughput')
+
+
+    models = {
+        u'near_queue.queue': {
+            'Meta': {'unique_together': "(('name',),)", 'object_name': 'Queue'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '64'})
+        },
+        u'near_queue.queueentry': {
+            'Meta': {'ordering': "('queue', 'sort_key', 'time_added', 'key')", 'unique_together': "(('queue', 'key'),)", 'object_name': 'QueueEntry', 'index_together': "[('queue', 'is_complete', 'time_added')]"},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_complete': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'key': ('django.db.models.fields.CharField', [], {'max_length': '256'}),
+            'queue': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['near_queue.Queue']"}),
+            'sort_key': ('django.db.models.fields.CharField', [], {'max_length': '256', 'null': 'True', 'blank': 'True'}),
+            'time_added': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'time_completed': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'})
+        },
+        u'near_queue.queuestats': {
+            'Meta': {'object_name': 'QueueStats'},
+            'completed': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'in_flight': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'pending': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'queue': ('django.db.models.fields.related.OneToOneField', [], {'related_name': "'stats'", 'unique': 'True', 'to': u"orm['near_queue.Queue']"})
+        },
+        u'near_queue.queuethroughput': {
+            'Meta': {'ordering': "('queue', '-hour')", 'unique_together': "(('queue', 'hour'),)", 'object_name': 'QueueThroughput'},
+            'completed': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'hour': ('django.db.models.fields.DateTimeField', [], {}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'queue': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['near_queue.Queue']"})
+        }
+    }
+
+    complete_apps = ['near_queue']
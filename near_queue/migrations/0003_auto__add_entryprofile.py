@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'EntryProfile'
+        db.create_table(u'near_queue_entryprofile', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('queue', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['near_queue.Queue'])),
+            ('key', self.gf('django.db.models.fields.CharField')(max_length=256)),
+            ('processor', self.gf('django.db.models.fields.CharField')(max_length=256)),
+            ('time_started', self.gf('django.db.models.fields.DateTimeField')()),
+            ('duration', self.gf('django.db.models.fields.FloatField')()),
+            ('input_bytes', self.gf('django.db.models.fields.BigIntegerField')(null=True, blank=True)),
+            ('rows', self.gf('django.db.models.fields.IntegerField')(null=True, blank=True)),
+            ('peak_memory', self.gf('django.db.models.fields.BigIntegerField')(null=True, blank=True)),
+            ('profile', self.gf('django.db.models.fields.TextField')(blank=True)),
+        ))
+        db.send_create_signal(u'near_queue', ['EntryProfile'])
+
+
+    def backwards(self, orm):
+        # Deleting model 'EntryProfile'
+        db.delete_table(u'near_queue_entryprofile')
+
+
+    models = {
+        u'near_queue.entryprofile': {
+            'Meta': {'ordering': "('-time_started',)", 'object_name': 'EntryProfile'},
+            'duration': ('django.db.models.fields.FloatField', [], {}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'input_bytes': ('django.db.models.fields.BigIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'key': ('django.db.models.fields.CharField', [], {'max_length': '256'}),
+            'peak_memory': ('django.db.models.fields.BigIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'processor': ('django.db.models.fields.CharField', [], {'max_length': '256'}),
+            'profile': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'queue': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['near_queue.Queue']"}),
+            'rows': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'time_started': ('django.db.models.fields.DateTimeField', [], {})
+        },
+        u'near_queue.queue': {
+            'Meta': {'unique_together': "(('name',),)", 'object_name': 'Queue'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '64'})
+        },
+        u'near_queue.queueentry': {
+            'Meta': {'ordering': "('queue', 'sort_key', 'time_added', 'key')", 'unique_together': "(('queue', 'key'),)", 'object_name': 'QueueEntry', 'index_together': "[('queue', 'is_complete', 'time_added')]"},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_complete': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'key': ('django.db.models.fields.CharField', [], {'max_length': '256'}),
+            'queue': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['near_queue.Queue']"}),
+            'sort_key': ('django.db.models.fields.CharField', [], {'max_length': '256', 'null': 'True', 'blank': 'True'}),
+            'time_added': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'time_completed': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'})
+        },
+        u'near_queue.queuestats': {
+            'Meta': {'object_name': 'QueueStats'},
+            'completed': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'in_flight': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'pending': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'queue': ('django.db.models.fields.related.OneToOneField', [], {'related_name': "'stats'", 'unique': 'True', 'to': u"orm['near_queue.Queue']"})
+        },
+        u'near_queue.queuethroughput': {
+            'Meta': {'ordering': "('queue', '-hour')", 'unique_together': "(('queue', 'hour'),)", 'object_name': 'QueueThroughput'},
+            'completed': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'hour': ('django.db.models.fields.DateTimeField', [], {}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'queue': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['near_queue.Queue']"})
+        }
+    }
+
+    complete_apps = ['near_queue']
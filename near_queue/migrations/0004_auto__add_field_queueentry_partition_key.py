@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding field 'QueueEntry.partition_key'
+        db.add_column(u'near_queue_queueentry', 'partition_key',
+                      self.gf('django.db.models.fields.CharField')(default='', max_length=256, blank=True),
+                      keep_default=False)
+
+        # Adding index on 'QueueEntry', fields ['queue', 'is_complete', 'partition_key', 'sort_key']
+        db.create_index(u'near_queue_queueentry', ['queue_id', 'is_complete', 'partition_key', 'sort_key'])
+
+
+    def backwards(self, orm):
+        # Removing index on 'QueueEntry', fields ['queue', 'is_complete', 'partition_key', 'sort_key']
+        db.delete_index(u'near_queue_queueentry', ['queue_id', 'is_complete', 'partition_key', 'sort_key'])
+
+        # Deleting field 'QueueEntry.partition_key'
+        db.delete_column(u'near_queue_queueentry', 'partition_key')
+
+
+    models = {
+        u'near_queue.entryprofile': {
+            'Meta': {'ordering': "('-time_started',)", 'object_name': 'EntryProfile'},
+            'duration': ('django.db.models.fields.FloatField', [], {}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'input_bytes': ('django.db.models.fields.BigIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'key': ('django.db.models.fields.CharField', [], {'max_length': '256'}),
+            'peak_memory': ('django.db.models.fields.BigIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'processor': ('django.db.models.fields.CharField', [], {'max_length': '256'}),
+            'profile': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'queue': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['near_queue.Queue']"}),
+            'rows': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'time_started': ('django.db.models.fields.DateTimeField', [], {})
+        },
+        u'near_queue.queue': {
+            'Meta': {'unique_together': "(('name',),)", 'object_name': 'Queue'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '64'})
+        },
+        u'near_queue.queueentry': {
+            'Meta': {'ordering': "('queue', 'sort_key', 'time_added', 'key')", 'unique_together': "(('queue', 'key'),)", 'object_name': 'QueueEntry', 'index_together': "[('queue', 'is_complete', 'time_added'), ('queue', 'is_complete', 'partition_key', 'sort_key')]"},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_complete': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'key': ('django.db.models.fields.CharField', [], {'max_length': '256'}),
+            'partition_key': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '256', 'blank': 'True'}),
+            'queue': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['near_queue.Queue']"}),
+            'sort_key': ('django.db.models.fields.CharField', [], {'max_length': '256', 'null': 'True', 'blank': 'True'}),
+            'time_added': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'time_completed': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'})
+        },
+        u'near_queue.queuestats': {
+            'Meta': {'object_name': 'QueueStats'},
+            'completed': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'in_flight': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'pending': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'queue': ('django.db.models.fields.related.OneToOneField', [], {'related_name': "'stats'", 'unique': 'True', 'to': u"orm['near_queue.Queue']"})
+        },
+        u'near_queue.queuethroughput': {
+            'Meta': {'ordering': "('queue', '-hour')", 'unique_together': "(('queue', 'hour'),)", 'object_name': 'QueueThroughput'},
+            'completed': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'hour': ('django.db.models.fields.DateTimeField', [], {}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'queue': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['near_queue.Queue']"})
+        }
+    }
+
+    complete_apps = ['near_queue']
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'PendingCleanup'
+        db.create_table(u'near_queue_pendingcleanup', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('kind', self.gf('django.db.models.fields.CharField')(max_length=16)),
+            ('endpoint', self.gf('django.db.models.fields.CharField')(max_length=256)),
+            ('path', self.gf('django.db.models.fields.CharField')(max_length=1024, blank=True)),
+            ('mailbox', self.gf('django.db.models.fields.CharField')(max_length=256, blank=True)),
+            ('uid', self.gf('django.db.models.fields.BigIntegerField')(null=True, blank=True)),
+            ('uid_validity', self.gf('django.db.models.fields.BigIntegerField')(null=True, blank=True)),
+            ('archive_mbox', self.gf('django.db.models.fields.CharField')(max_length=256, blank=True)),
+            ('time_added', self.gf('django.db.models.fields.DateTimeField')(auto_now_add=True, blank=True)),
+            ('attempts', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('last_error', self.gf('django.db.models.fields.TextField')(blank=True)),
+        ))
+        db.send_create_signal(u'near_queue', ['PendingCleanup'])
+
+        # Adding index on 'PendingCleanup', fields ['kind', 'endpoint']
+        db.create_index(u'near_queue_pendingcleanup', ['kind', 'endpoint'])
+
+
+    def backwards(self, orm):
+        # Removing index on 'PendingCleanup', fields ['kind', 'endpoint']
+        db.delete_index(u'near_queue_pendingcleanup', ['kind', 'endpoint'])
+
+        # Deleting model 'PendingCleanup'
+        db.delete_table(u'near_queue_pendingcleanup')
+
+
+    models = {
+        u'near_queue.entryprofile': {
+            'Meta': {'ordering': "('-time_started',)", 'object_name': 'EntryProfile'},
+            'duration': ('django.db.models.fields.FloatField', [], {}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'input_bytes': ('django.db.models.fields.BigIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'key': ('django.db.models.fields.CharField', [], {'max_length': '256'}),
+            'peak_memory': ('django.db.models.fields.BigIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'processor': ('django.db.models.fields.CharField', [], {'max_length': '256'}),
+            'profile': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'queue': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['near_queue.Queue']"}),
+            'rows': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'time_started': ('django.db.models.fields.DateTimeField', [], {})
+        },
+        u'near_queue.pendingcleanup': {
+            'Meta': {'ordering': "('time_added',)", 'object_name': 'PendingCleanup', 'index_together': "[('kind', 'endpoint')]"},
+            'archive_mbox': ('django.db.models.fields.CharField', [], {'max_length': '256', 'blank': 'True'}),
+            'attempts': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'endpoint': ('django.db.models.fields.CharField', [], {'max_length': '256'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'kind': ('django.db.models.fields.CharField', [], {'max_length': '16'}),
+            'last_error': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'mailbox': ('django.db.models.fields.CharField', [], {'max_length': '256', 'blank': 'True'}),
+            'path': ('django.db.models.fields.CharField', [], {'max_length': '1024', 'blank': 'True'}),
+            'time_added': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'uid': ('django.db.models.fields.BigIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'uid_validity': ('django.db.models.fields.BigIntegerField', [], {'null': 'True', 'blank': 'True'})
+        },
+        u'near_queue.queue': {
+            'Meta': {'unique_together': "(('name',),)", 'object_name': 'Queue'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '64'})
+        },
+        u'near_queue.queueentry': {
+            'Meta': {'ordering': "('queue', 'sort_key', 'time_added', 'key')", 'unique_together': "(('queue', 'key'),)", 'object_name': 'QueueEntry', 'index_together': "[('queue', 'is_complete', 'time_added'), ('queue', 'is_complete', 'partition_key', 'sort_key')]"},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_complete': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'key': ('django.db.models.fields.CharField', [], {'max_length': '256'}),
+            'partition_key': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '256', 'blank': 'True'}),
+            'queue': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['near_queue.Queue']"}),
+            'sort_key': ('django.db.models.fields.CharField', [], {'max_length': '256', 'null': 'True', 'blank': 'True'}),
+            'time_added': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'time_completed': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'})
+        },
+        u'near_queue.queuestats': {
+            'Meta': {'object_name': 'QueueStats'},
+            'completed': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'in_flight': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'pending': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'queue': ('django.db.models.fields.related.OneToOneField', [], {'related_name': "'stats'", 'unique': 'True', 'to': u"orm['near_queue.Queue']"})
+        },
+        u'near_queue.queuethroughput': {
+            'Meta': {'ordering': "('queue', '-hour')", 'unique_together': "(('queue', 'hour'),)", 'object_name': 'QueueThroughput'},
+            'completed': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'hour': ('django.db.models.fields.DateTimeField', [], {}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'queue': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['near_queue.Queue']"})
+        }
+    }
+
+    complete_apps = ['near_queue']
@@ -1,5 +1,6 @@
 import datetime
 from django.db import models
+from django.db.models import F
 
 
 class Queue(models.Model):
@@ -17,24 +18,252 @@ class QueueEntry(models.Model):
     Simple queue for handling files to be processed.
 
     Refer to different queue's by specifying queue.
+
+    Entries are processed in sort_key order within their partition_key,
+    different partitions may be processed in parallel.
     """
     queue = models.ForeignKey(Queue)
 
     sort_key = models.CharField(max_length=256, null=True, blank=True)
+    partition_key = models.CharField(max_length=256, blank=True, default='')
     key = models.CharField(max_length=256)
     is_complete = models.BooleanField(default=False)
     time_completed = models.DateTimeField(null=True, blank=True)
+    # while being worked on, see DjangoBackend.claim.
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    claimed_by = models.CharField(max_length=128, blank=True, default='')
 
     time_added = models.DateTimeField(auto_now_add=True)
 
+    def __init__(self, *args, **kwargs):
+        super(QueueEntry, self).__init__(*args, **kwargs)
+        self._was_complete = self.is_complete if self.pk else None
+
     def __unicode__(self):
         return '{0}: {1} - {2}'.format(self.queue, self.key, self.is_complete)
 
+    def save(self, *args, **kwargs):
+        was_complete = self._was_complete
+        super(QueueEntry, self).save(*args, **kwargs)
+        if was_complete != self.is_complete:
+            if was_complete is None:
+                QueueStats.record_added(self.queue_id, 1, self.is_complete)
+            elif self.is_complete:
+                QueueStats.record_completed(self.queue_id, 1,
+                                            self.time_completed)
+            else:
+                QueueStats.record_reopened(self.queue_id, 1)
+        self._was_complete = self.is_complete
+
+    def delete(self, *args, **kwargs):
+        queue_id, is_complete = self.queue_id, self.is_complete
+        super(QueueEntry, self).delete(*args, **kwargs)
+        QueueStats.record_added(queue_id, -1, is_complete)
+
     def mark_as_complete(self):
         self.is_complete = True
+        self.claimed_until = None
+        self.claimed_by = ''
         self.time_completed = datetime.datetime.utcnow()
         self.save()
 
     class Meta:
         unique_together = ('queue', 'key')
+        index_together = [('queue', 'is_complete', 'time_added'),
+                          ('queue', 'is_complete', 'partition_key',
+                           'sort_key')]
         ordering = ('queue', 'sort_key', 'time_added', 'key')
+
+
+class QueueStats(models.Model):
+    """
+    Per queue counters, kept up to date as entries are added and completed
+    so monitoring never has to count QueueEntry rows.
+
+    Bulk updates bypass the counters, use the rebuild_queue_stats command
+    to recount after those.
+    """
+    queue = models.OneToOneField(Queue, related_name='stats')
+
+    pending = models.IntegerField(default=0)
+    in_flight = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+
+    def __unicode__(self):
+        return '{0}: {1} pending'.format(self.queue, self.pending)
+
+    @classmethod
+    def _adjust(cls, queue_id, **deltas):
+        updates = dict((field, F(field) + delta)
+                       for field, delta in deltas.items())
+        stats = cls.objects.filter(queue_id=queue_id)
+        # one query, except the first time for a queue.
+        if not stats.update(**updates):
+            cls.objects.get_or_create(queue_id=queue_id)
+            stats.update(**updates)
+
+    @classmethod
+    def record_added(cls, queue_id, n, is_complete=False):
+        if is_complete:
+            cls._adjust(queue_id, completed=n)
+        else:
+            cls._adjust(queue_id, pending=n)
+
+    @classmethod
+    def record_completed(cls, queue_id, n, time_completed=None):
+        cls._adjust(queue_id, pending=-n, completed=n)
+        QueueThroughput.record(queue_id, n, time_completed)
+
+    @classmethod
+    def record_reopened(cls, queue_id, n):
+        cls._adjust(queue_id, pending=n, completed=-n)
+
+    @classmethod
+    def record_in_flight(cls, queue_id, n):
+        cls._adjust(queue_id, in_flight=n)
+
+    @classmethod
+    def rebuild(cls, queue):
+        """Recount from QueueEntry, resets in_flight."""
+        entries = QueueEntry.objects.filter(queue=queue)
+        stats, _ = cls.objects.get_or_create(queue=queue)
+        stats.pending = entries.filter(is_complete=False).count()
+        stats.completed = entries.filter(is_complete=True).count()
+        stats.in_flight = 0
+        stats.save()
+        return stats
+
+    def oldest_pending(self):
+        oldest = QueueEntry.objects.filter(queue=self.queue_id,
+                                           is_complete=False)
+        oldest = oldest.order_by('time_added')
+        oldest = oldest.values_list('time_added', flat=True)[:1]
+        return oldest[0] if oldest else None
+
+    def summary(self, hours=24):
+        """JSON friendly dict of counters, age and hourly throughput."""
+        now = datetime.datetime.utcnow()
+        oldest = self.oldest_pending()
+        if oldest is not None:
+            oldest = (now - oldest.replace(tzinfo=None)).total_seconds()
+        since = QueueThroughput.truncate(now) - datetime.timedelta(
+            hours=hours - 1)
+        throughput = QueueThroughput.objects.filter(queue=self.queue_id,
+                                                    hour__gte=since)
+        return {
+            'queue': self.queue.name,
+            'pending': self.pending,
+            'in_flight': self.in_flight,
+            'completed': self.completed,
+            'oldest_pending_age': oldest,
+            'completed_per_hour': [
+                {'hour': t.hour.isoformat(), 'completed': t.completed}
+                for t in throughput.order_by('hour')
+            ],
+        }
+
+
+class QueueThroughput(models.Model):
+    """Entries completed per queue per hour."""
+    queue = models.ForeignKey(Queue)
+    hour = models.DateTimeField()
+    completed = models.IntegerField(default=0)
+
+    def __unicode__(self):
+        return '{0}: {1} - {2}'.format(self.queue, self.hour, self.completed)
+
+    @staticmethod
+    def truncate(dt):
+        return dt.replace(minute=0, second=0, microsecond=0)
+
+    @classmethod
+    def record(cls, queue_id, n, when=None):
+        if when is None:
+            when = datetime.datetime.utcnow()
+        hour = cls.truncate(when)
+        throughput = cls.objects.filter(queue_id=queue_id, hour=hour)
+        if not throughput.update(completed=F('completed') + n):
+            cls.objects.get_or_create(queue_id=queue_id, hour=hour)
+            throughput.update(completed=F('completed') + n)
+
+    class Meta:
+        unique_together = ('queue', 'hour')
+        ordering = ('queue', '-hour')
+
+
+class EntryProfile(models.Model):
+    """
+    Cost of one processor call on a queue entry, recorded when the
+    processor sets PROFILE (see near_queue.profiling).
+    """
+    queue = models.ForeignKey(Queue)
+    key = models.CharField(max_length=256)
+    processor = models.CharField(max_length=256)
+
+    time_started = models.DateTimeField()
+    duration = models.FloatField()
+    input_bytes = models.BigIntegerField(null=True, blank=True)
+    rows = models.IntegerField(null=True, blank=True)
+    peak_memory = models.BigIntegerField(null=True, blank=True)
+    profile = models.TextField(blank=True)
+    failed = models.BooleanField(default=False)
+
+    def __unicode__(self):
+        return '{0}: {1} - {2:.3f}s'.format(self.queue, self.key,
+                                            self.duration)
+
+    class Meta:
+        ordering = ('-time_started',)
+
+
+class PendingCleanup(models.Model):
+    """
+    Removal of a source (SFTP file, IMAP message) now safely on S3.
+
+    Recorded as each source is uploaded and applied in bulk afterwards by
+    near_queue.cleanup, anything failing stays here to be retried.
+    endpoint is near_queue.retry.endpoint_name of the account.
+    """
+    SFTP_REMOVE = 'sftp_remove'
+    IMAP_MOVE = 'imap_move'
+    KINDS = (
+        (SFTP_REMOVE, 'SFTP remove'),
+        (IMAP_MOVE, 'IMAP move'),
+    )
+
+    kind = models.CharField(max_length=16, choices=KINDS)
+    endpoint = models.CharField(max_length=256)
+
+    path = models.CharField(max_length=1024, blank=True)
+
+    mailbox = models.CharField(max_length=256, blank=True)
+    uid = models.BigIntegerField(null=True, blank=True)
+    uid_validity = models.BigIntegerField(null=True, blank=True)
+    archive_mbox = models.CharField(max_length=256, blank=True)
+
+    time_added = models.DateTimeField(auto_now_add=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    def __unicode__(self):
+        if self.kind == self.IMAP_MOVE:
+            return '{0}: move {1};UID={2} to {3}'.format(
+                self.endpoint, self.mailbox, self.uid, self.archive_mbox)
+        return '{0}: remove {1}'.format(self.endpoint, self.path)
+
+    @classmethod
+    def record_sftp_remove(cls, endpoint, path):
+        return cls.objects.create(kind=cls.SFTP_REMOVE, endpoint=endpoint,
+                                  path=path)
+
+    @classmethod
+    def record_imap_move(cls, endpoint, mailbox, uid, uid_validity,
+                         archive_mbox):
+        return cls.objects.create(kind=cls.IMAP_MOVE, endpoint=endpoint,
+                                  mailbox=mailbox, uid=uid,
+                                  uid_validity=uid_validity,
+                                  archive_mbox=archive_mbox)
+
+    class Meta:
+        index_together = [('kind', 'endpoint')]
+        ordering = ('time_added',)
@@ -1,20 +1,33 @@
 import abc
+import datetime
+import fnmatch
 import logging
 import os
+import posixpath
 import re
-import rowdy.sftp
+import shutil
+import threading
 
 from contextlib import contextmanager
-from tempfile import mkstemp
 
-from boto.s3.connection import S3Connection
-from boto.s3.key import Key
+from django.db import connection
 
+from near_queue.backends import get_backend
+from near_queue.keylayout import get_key_layout
+from near_queue.models import EntryProfile
+from near_queue.models import PendingCleanup
 from near_queue.models import Queue
-from near_queue.models import QueueEntry
+from near_queue.profiling import MODES as PROFILE_MODES
+from near_queue.profiling import profiling
+from near_queue.retry import CircuitOpen
+from near_queue.retry import breaker_name
+from near_queue.retry import call_with_retry
+from near_queue.retry import endpoint_name
+from near_queue.retry import is_transient
+from near_queue.scratch import get_scratch_space
+from near_queue.transports import get_transport
 from near_queue.utils import gzip_file
-from near_queue.utils import gpg_decrypt
-from near_queue.utils import gpg_encrypt
+from near_queue.utils import mapped_file
 
 
 logger = logging.getLogger(__name__.split('.')[0])
@@ -27,74 +40,228 @@ def log_before_and_after(msg):
     logger.info('(complete) ' + msg)
 
 
+@contextmanager
+def _renewing_claim(backend, entry):
+    """
+    Renew the claim on entry every quarter of the backend's lease until
+    the block is done, so nothing else claims an entry that takes longer.
+    """
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(backend.lease / 4.0):
+            try:
+                if not backend.renew(entry):
+                    logger.warning('lost claim on {0}'.format(entry))
+                    return
+            except Exception:
+                logger.exception('renewing claim on {0} failed'.format(
+                    entry))
+
+    renewer = threading.Thread(target=_closing_db_connection(renew))
+    renewer.daemon = True
+    renewer.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        renewer.join()
+
+
+def _complete(backend, entry):
+    if not backend.complete(entry):
+        logger.warning('lost claim on {0}, leaving it to whoever has it '
+                       'now'.format(entry))
+
+
+def _handle_entries(queue_name, handle_fn, endpoint_fn=None):
+    """
+    Claim each pending entry, call handle_fn on it then complete it. A
+    failing entry is logged and left queued for the next run.
+
+    endpoint_fn(entry) is the breaker name of the endpoint entry comes
+    from. Once its circuit is open the rest of that endpoint's entries are
+    skipped, once any other's (e.g. S3's, which they all need) is the
+    whole queue is left for next time.
+    """
+    backend = get_backend()
+    down = set()
+    for entry in backend.pending(queue_name):
+        endpoint = endpoint_fn(entry) if endpoint_fn else None
+        if endpoint in down or not backend.claim(entry):
+            continue
+        try:
+            with log_before_and_after('handling: {0}'.format(entry)):
+                with _renewing_claim(backend, entry):
+                    handle_fn(entry)
+        except CircuitOpen as e:
+            backend.release(entry)
+            if endpoint is None or str(e) != endpoint:
+                logger.warning('{0} is down, leaving rest of {1} '
+                               'queued'.format(e, entry.queue))
+                return
+            logger.warning('{0} is down, leaving its entries in {1} '
+                           'queued'.format(e, entry.queue))
+            down.add(endpoint)
+        except Exception:
+            backend.release(entry)
+            logger.exception('failed, leaving queued: {0}'.format(entry))
+        else:
+            _complete(backend, entry)
+
+
+def _sftp_call(sftp_account, fn):
+    """fn(sftp) on a fresh connection, retrying transient failures."""
+    def attempt():
+        sftp = get_transport('sftp').connect(sftp_account)
+        sftp.open_connection()
+        try:
+            return fn(sftp)
+        finally:
+            sftp.close_connection()
+    return call_with_retry(attempt, breaker_name('sftp', sftp_account))
+
+
+def _imap_call(imap_account, fn):
+    """fn(imap_account) on an open connection, retrying transient failures."""
+    def attempt():
+        imap = get_transport('imap').connect(imap_account)
+        imap.open_connection()
+        try:
+            return fn(imap)
+        finally:
+            imap.close_connection()
+    return call_with_retry(attempt, breaker_name('imap', imap_account))
+
+
+def _s3_call(s3_account, fn):
+    """fn(bucket), retrying transient failures."""
+    def attempt():
+        return fn(get_transport('s3').get_bucket(s3_account))
+    return call_with_retry(attempt, breaker_name('s3', s3_account))
+
+
 class Processor(object):
-    """Base class"""
+    """
+    Base class
+
+    Set MMAP_FILE = True to have processor called with a read-only
+    memoryview of the (decrypted) file instead of its filename, see
+    near_queue.utils.iter_csv_lines for splitting it into lines.
+
+    S3_KEY_LAYOUT = None/'flat', 'date' or 'hash' (see near_queue.keylayout)
+    partitions S3_DIRECTORY so rebuild_process_queue can list it in
+    parallel.
+
+    PROFILE = None, 'timing', 'cprofile' or 'sample' records the cost of
+    each processor call as an EntryProfile (see near_queue.profiling), with
+    PROFILE_MEMORY = True adding peak memory. processor may return the
+    number of rows it handled to have that recorded too.
+
+    Files are processed in order, one at a time. If order only matters
+    within e.g. a partner or a date, override partition_key to return that
+    for an S3 key, and set PARTITION_WORKERS to process that many
+    partitions at once (in threads, so processor must be thread safe).
+    A file that fails to download stops only its own partition.
+    """
 
     __metaclass__ = abc.ABCMeta
 
+    MMAP_FILE = False
+    S3_KEY_LAYOUT = None
+    PROFILE = None
+    PROFILE_MEMORY = False
+    PARTITION_WORKERS = 1
+
     @classmethod
     def process_queued_files(cls):
         process_s3_files(queue_name=cls.S3_PROCESS_QUEUE,
                          s3_account=cls.S3_ACCOUNT,
                          processor_fn=cls.processor,
-                         decrypt=cls.ENCRYPT_FILE)
+                         decrypt=cls.ENCRYPT_FILE,
+                         use_mmap=cls.MMAP_FILE,
+                         profile=cls.PROFILE,
+                         profile_memory=cls.PROFILE_MEMORY,
+                         profile_name='{0}.{1}'.format(cls.__module__,
+                                                       cls.__name__),
+                         workers=cls.PARTITION_WORKERS)
 
     @staticmethod
     def processor(localpath):
         raise NotImplemented
 
+    @staticmethod
+    def partition_key(s3_key):
+        """Partition of the process queue s3_key goes in, None for one."""
+        return None
+
     @classmethod
     def retrieve_and_process_files(cls):
         """
         Looks for remote files, put them on s3, processes them.
         """
-        cls.enqueue_files_for_s3_uploading()
+        try:
+            cls.enqueue_files_for_s3_uploading()
+        except Exception as e:
+            if not (isinstance(e, CircuitOpen) or is_transient(e)):
+                raise
+            # still work through whatever was queued by earlier runs.
+            logger.warning('not enqueueing {0}: {1!r}'.format(cls.__name__,
+                                                              e))
         cls.put_files_on_s3()
         cls.process_queued_files()
 
+    @classmethod
+    def rebuild_process_queue(cls, since=None, workers=8, dry_run=False):
+        """
+        Queue any file under S3_DIRECTORY missing from S3_PROCESS_QUEUE, see
+        near_queue.reconcile.
+        """
+        from near_queue.reconcile import rebuild_process_queue
+        return rebuild_process_queue(queue_name=cls.S3_PROCESS_QUEUE,
+                                     s3_account=cls.S3_ACCOUNT,
+                                     s3_directory=cls.S3_DIRECTORY,
+                                     key_layout=cls.S3_KEY_LAYOUT,
+                                     since=since,
+                                     workers=workers,
+                                     dry_run=dry_run,
+                                     partition_fn=cls.partition_key)
+
 
 def _add_keys_to_upload_queue(keys, queue_name):
-    q, _ = Queue.objects.get_or_create(name=queue_name)
-    for key in keys:
-        qe, created = QueueEntry.objects.get_or_create(queue=q,
-                                                       key=key)
-        if created:
-            logger.info('queued: {0}'.format(qe))
-        else:
-            logger.info('already in queue: {0}'.format(qe))
+    get_backend().enqueue(queue_name, keys)
 
 
-def _add_keys_to_process_queue(keys, queue_name):
-    process_q, _ = Queue.objects.get_or_create(name=queue_name)
-    for key in keys:
-        qe, _ = QueueEntry.objects.get_or_create(queue=process_q,
-                                                 key=key,
-                                                 sort_key=key)
-        qe.is_complete = False
-        qe.save()
+def _add_keys_to_process_queue(keys, queue_name, key_layout=None,
+                               partition_fn=None):
+    get_backend().enqueue(queue_name, keys,
+                          sort_key_fn=get_key_layout(key_layout).sort_key,
+                          reopen=True,
+                          partition_fn=partition_fn)
 
 
 def _put_on_s3(localpath, s3_key, s3_account, compress, gpg_recipient):
     """
     put file on s3, optionally gzip, optionally gpg encrypt.
     """
-    conn = S3Connection(aws_access_key_id=s3_account.access_key,
-                        aws_secret_access_key=s3_account.secret_key,
-                        host=s3_account.host)
-    bucket = conn.get_bucket(s3_account.bucket)
     tempfile = localpath
-    if compress:
-        s3_key += '.gz'
-        tempfile = gzip_file(tempfile)
-    if gpg_recipient is not None:
-        s3_key += '.gpg'
-        tempfile = gpg_encrypt(tempfile, gpg_recipient)
-    k = Key(bucket, name=s3_key)
-    k.set_contents_from_filename(tempfile)
-    if compress:
-        os.remove(localpath + '.gz')
-    if gpg_recipient is not None:
-        os.remove(localpath + '.gpg')
+    copies = []
+    try:
+        if compress:
+            s3_key += '.gz'
+            tempfile = gzip_file(tempfile)
+            copies.append(tempfile)
+        if gpg_recipient is not None:
+            s3_key += '.gpg'
+            tempfile = get_transport('gpg').encrypt(tempfile, gpg_recipient)
+            copies.append(tempfile)
+        _s3_call(s3_account,
+                 lambda bucket: get_transport('s3').upload(bucket, s3_key,
+                                                           tempfile))
+    finally:
+        for copy in copies:
+            if os.path.exists(copy):
+                os.remove(copy)
     return s3_key
 
 
@@ -112,16 +279,39 @@ class SFTP_S3_CSV_Processor(Processor):
     SFTP_FILE_REGEX = 'X'
     COMPRESS_FILE = bool
     #REMOVE_FROM_SFTP = settings.DELETE_SFTP_AFTER_S3_UPLOAD
+
+    To look in more than one folder (or account), instead of SFTP_FOLDER
+    and SFTP_FILE_REGEX set
+    SFTP_SOURCES = [SFTPSource('X', file_regex='X'),
+                    SFTPSource('X', pattern='*.csv', recursive=True,
+                               account=SFTPAccount(...))]
+    #SFTP_LISTING_WORKERS = 4
+    Files keep their path relative to their source's folder under
+    S3_DIRECTORY, below the account's user@host unless it is the default
+    SFTP_ACCOUNT, so files of the same name in different folders or
+    accounts don't overwrite each other.
     """
 
     __metaclass__ = abc.ABCMeta
 
+    SFTP_SOURCES = None
+    SFTP_LISTING_WORKERS = 4
+
+    @classmethod
+    def sftp_sources(cls):
+        if cls.SFTP_SOURCES is None:
+            return [SFTPSource(cls.SFTP_FOLDER,
+                               file_regex=cls.SFTP_FILE_REGEX,
+                               account=cls.SFTP_ACCOUNT)]
+        return [source.with_account(cls.SFTP_ACCOUNT)
+                for source in cls.SFTP_SOURCES]
+
     @classmethod
     def enqueue_files_for_s3_uploading(cls):
-        enqueue_sftp_files(queue_name=cls.S3_UPLOAD_QUEUE,
-                           sftp_account=cls.SFTP_ACCOUNT,
-                           sftp_folder=cls.SFTP_FOLDER,
-                           file_regex=cls.SFTP_FILE_REGEX)
+        enqueue_sftp_sources(queue_name=cls.S3_UPLOAD_QUEUE,
+                             sources=cls.sftp_sources(),
+                             default_account=cls.SFTP_ACCOUNT,
+                             workers=cls.SFTP_LISTING_WORKERS)
 
     @classmethod
     def put_files_on_s3(cls):
@@ -134,94 +324,377 @@ class SFTP_S3_CSV_Processor(Processor):
                                 sftp_account=cls.SFTP_ACCOUNT,
                                 s3_account=cls.S3_ACCOUNT,
                                 s3_directory=cls.S3_DIRECTORY,
+                                key_layout=cls.S3_KEY_LAYOUT,
                                 remove_from_sftp=cls.REMOVE_FROM_SFTP,
                                 compress=cls.COMPRESS_FILE,
-                                gpg_recipient=gpg_recipient)
+                                gpg_recipient=gpg_recipient,
+                                sftp_sources=cls.sftp_sources(),
+                                partition_fn=cls.partition_key)
+
+
+class SFTPSource(object):
+    """
+    A folder to look for files in.
+
+    file_regex is matched against the whole remote path (like
+    SFTP_FILE_REGEX), pattern is a glob matched against the file name,
+    a file must match both (when given). account defaults to the
+    processor's SFTP_ACCOUNT.
+    """
+
+    def __init__(self, folder, file_regex=None, pattern=None,
+                 recursive=False, account=None):
+        self.folder = folder
+        self.file_regex = file_regex
+        self.pattern = pattern
+        self.recursive = recursive
+        self.account = account
+
+    def __repr__(self):
+        return 'SFTPSource({0!r}, recursive={1})'.format(self.folder,
+                                                         self.recursive)
+
+    def with_account(self, account):
+        if self.account is not None:
+            return self
+        return SFTPSource(self.folder, self.file_regex, self.pattern,
+                          self.recursive, account)
+
+    def matches(self, path):
+        if self.file_regex is not None and not re.match(self.file_regex,
+                                                        path):
+            return False
+        if self.pattern is not None and not fnmatch.fnmatch(
+                os.path.basename(path), self.pattern):
+            return False
+        return True
+
+    def list_files(self, sftp):
+        """
+        Matching files, descending into sub-folders if recursive. Folders
+        themselves are never matched.
+        """
+        transport = get_transport('sftp')
+        found = []
+        folders = [self.folder]
+        while folders:
+            folder = folders.pop()
+            for name, is_folder in transport.list_folder(
+                    sftp, folder, find_folders=self.recursive):
+                path = os.path.join(folder, name)
+                if is_folder:
+                    if self.recursive:
+                        folders.append(path)
+                elif self.matches(path):
+                    if is_folder is None and transport.is_folder(sftp, path):
+                        # only asked about now it would be queued.
+                        continue
+                    found.append(path)
+        return found
+
+
+def _sftp_key(account, path, default_account):
+    """Queue key for path, prefixed with its account unless the default."""
+    if account is default_account:
+        return path
+    return '{0}/{1}'.format(endpoint_name('sftp', account), path)
+
+
+def _sftp_s3_name(account, path, default_account, sources=()):
+    """
+    Name of path under S3_DIRECTORY, relative to the folder of the source
+    it was found in (just the file name for a flat one), and below the
+    account's user@host unless it is the default.
+    """
+    name = posixpath.basename(path)
+    folders = [source.folder for source in sources
+               if source.account is account]
+    for folder in sorted(folders, key=len, reverse=True):
+        relative = posixpath.relpath(path, folder)
+        if not relative.startswith('..'):
+            name = relative
+            break
+    if account is not default_account:
+        endpoint = endpoint_name('sftp', account)
+        name = posixpath.join(endpoint.split('://', 1)[-1], name)
+    return name
+
+
+def _resolve_sftp_key(key, default_account, accounts=()):
+    """(account, path) for a key made by _sftp_key"""
+    for account in accounts:
+        prefix = endpoint_name('sftp', account) + '/'
+        if key.startswith(prefix):
+            return account, key[len(prefix):]
+    return default_account, key
 
 
 def enqueue_sftp_files(queue_name, sftp_account, sftp_folder, file_regex):
-    sftp = rowdy.sftp.SFTPConnection(sftp_account.username,
-                                     sftp_account.password,
-                                     sftp_account.hostname)
-    sftp.open_connection()
-    files = sftp.listdir(sftp_folder)
-    files = [os.path.join(sftp_folder, f) for f in files]
-    keys = [f for f in files if re.match(file_regex, f)]
-    sftp.close_connection()
+    source = SFTPSource(sftp_folder, file_regex=file_regex,
+                        account=sftp_account)
+    enqueue_sftp_sources(queue_name, [source], default_account=sftp_account)
+
+
+def enqueue_sftp_sources(queue_name, sources, default_account, workers=4):
+    """
+    List every source concurrently (one connection each, at most workers at
+    a time) and queue everything found in one batch. A source that can't be
+    listed is logged and skipped.
+    """
+    from multiprocessing.pool import ThreadPool
+
+    def list_source(source):
+        try:
+            files = _sftp_call(source.account, source.list_files)
+        except Exception:
+            logger.exception('cannot list {0}'.format(source))
+            return []
+        return [_sftp_key(source.account, f, default_account) for f in files]
+
+    pool = ThreadPool(max(1, min(workers, len(sources))))
+    try:
+        listings = pool.map(list_source, sources)
+    finally:
+        pool.close()
+        pool.join()
+    keys = [key for listing in listings for key in listing]
     _add_keys_to_upload_queue(keys, queue_name)
 
 
 def send_sftp_files_into_s3(sftp_queue, s3_queue, sftp_account, s3_account,
                             s3_directory, remove_from_sftp=False,
-                            compress=True, gpg_recipient=None):
-    upload_q, _ = Queue.objects.get_or_create(name=sftp_queue)
-    entries = QueueEntry.objects.filter(queue=upload_q, is_complete=False)
-    for entry in entries:
-        with log_before_and_after('handling: {0}'.format(entry)):
-            s3_keys = _put_sftp_file_on_s3(entry.key, s3_account, s3_directory,
-                                           sftp_account,
-                                           remove_from_sftp=remove_from_sftp,
-                                           compress=compress,
-                                           gpg_recipient=gpg_recipient)
-            _add_keys_to_process_queue(s3_keys, s3_queue)
-            entry.mark_as_complete()
+                            compress=True, gpg_recipient=None,
+                            sftp_accounts=(), key_layout=None,
+                            partition_fn=None, sftp_sources=()):
+    """
+    Upload each queued file. sftp_sources (or just sftp_accounts) are those
+    the files were queued from, see _sftp_s3_name for where they go. With
+    remove_from_sftp the uploaded files (and any left by earlier runs) are
+    removed in bulk once the queue is worked through, see near_queue.cleanup.
+    """
+    accounts = list(sftp_accounts) + [source.account
+                                      for source in sftp_sources]
+    cleanup_accounts = [account for account in [sftp_account] + accounts
+                        if account is not None]
+    if remove_from_sftp:
+        # an account the removes can't be recorded for fails before
+        # anything is uploaded.
+        for account in cleanup_accounts:
+            endpoint_name('sftp', account)
+
+    def resolve(entry):
+        return _resolve_sftp_key(entry.key, sftp_account, accounts)
+
+    def handle(entry):
+        account, fname = resolve(entry)
+        name = _sftp_s3_name(account, fname, sftp_account, sftp_sources)
+        s3_keys = _put_sftp_file_on_s3(fname, s3_account, s3_directory,
+                                       account,
+                                       remove_from_sftp=remove_from_sftp,
+                                       compress=compress,
+                                       gpg_recipient=gpg_recipient,
+                                       key_layout=key_layout,
+                                       name=name)
+        _add_keys_to_process_queue(s3_keys, s3_queue, key_layout,
+                                   partition_fn)
+    _handle_entries(sftp_queue, handle,
+                    lambda entry: breaker_name('sftp', resolve(entry)[0]))
+    if remove_from_sftp:
+        from near_queue.cleanup import apply_cleanups
+        apply_cleanups(sftp_accounts=cleanup_accounts)
 
 
 def _put_sftp_file_on_s3(fname, s3_account, s3_directory, sftp_account,
                          remove_from_sftp=False, compress=True,
-                         gpg_recipient=None):
-    sftp = rowdy.sftp.SFTPConnection(sftp_account.username,
-                                     sftp_account.password,
-                                     sftp_account.hostname)
-    _, tempfile = mkstemp()
-    sftp.open_connection()
-    sftp.get(fname, tempfile)
-    sftp.close_connection()
-
-    s3_key = os.path.join(s3_directory, os.path.basename(fname))
-    keys = {
-        tempfile: s3_key,
-    }
-
+                         gpg_recipient=None, key_layout=None, name=None):
+    if remove_from_sftp:
+        endpoint = endpoint_name('sftp', sftp_account)
     s3_keys = []
-    for localpath, s3_key in keys.iteritems():
-        s3_location = _put_on_s3(localpath, s3_key, s3_account, compress,
+    transport = get_transport('sftp')
+    size = _sftp_call(sftp_account,
+                      lambda sftp: transport.file_size(sftp, fname))
+    if size is not None:
+        # room for the download plus its .gz and .gpg copies.
+        size *= 1 + bool(compress) + (gpg_recipient is not None)
+    with get_scratch_space().tempfile(size=size) as tempfile:
+        _sftp_call(sftp_account, lambda sftp: sftp.get(fname, tempfile))
+
+        s3_key = get_key_layout(key_layout).key(
+            s3_directory, name or os.path.basename(fname))
+        s3_location = _put_on_s3(tempfile, s3_key, s3_account, compress,
                                  gpg_recipient)
-        os.remove(localpath)
         s3_keys.append(s3_location)
 
     if remove_from_sftp:
-        sftp.open_connection()
-        sftp.remove(fname)
-        sftp.close_connection()
+        # removed along with the rest by send_sftp_files_into_s3.
+        PendingCleanup.record_sftp_remove(endpoint, fname)
 
     return s3_keys
 
 
-def process_s3_files(queue_name, s3_account, processor_fn, decrypt):
-    q, _ = Queue.objects.get_or_create(name=queue_name)
-    entries = QueueEntry.objects.filter(queue=q, is_complete=False)
-    with log_before_and_after('handling: {0}'.format(queue_name)):
-        for entry in entries:
-            with log_before_and_after('handling: {0}'.format(entry)):
-                base = os.path.basename(entry.key)
-                _, tmp_fname = mkstemp(suffix=base)
-
-                s3_secret = s3_account.secret_key
-                conn = S3Connection(aws_access_key_id=s3_account.access_key,
-                                    aws_secret_access_key=s3_secret,
-                                    host=s3_account.host)
-                bucket = conn.get_bucket(s3_account.bucket)
-
-                k = Key(bucket, name=entry.key)
-                k.get_contents_to_filename(tmp_fname)
+def process_s3_files(queue_name, s3_account, processor_fn, decrypt,
+                     use_mmap=False, profile=None, profile_memory=False,
+                     profile_name=None, workers=1):
+    """
+    Process each of queue_name's partitions in order, up to workers of
+    them at once. Should processor_fn raise, the rest of its partition is
+    left queued and the exception re-raised once the others are done.
 
-                if decrypt:
-                    tmp_fname = gpg_decrypt(tmp_fname, delete_original=True)
-                processor_fn(tmp_fname)
+    Memory profiling (tracemalloc) is process wide, so it can't tell
+    workers apart and needs workers=1.
+    """
+    if profile is not None and profile_memory and workers > 1:
+        raise ValueError('cannot profile memory with {0} workers'.format(
+            workers))
+    backend = get_backend()
+    scratch = get_scratch_space()
+    if profile is not None:
+        run = _profiled(processor_fn, profile, profile_memory, profile_name)
+    else:
+        def run(arg, entry, input_bytes):
+            return processor_fn(arg)
+
+    def process(partition):
+        try:
+            _process_s3_partition(backend, queue_name, partition, s3_account,
+                                  run, decrypt, use_mmap, scratch)
+        except Exception as e:
+            logger.exception('failed, leaving rest of partition queued: '
+                             '{0} {1!r}'.format(queue_name, partition))
+            return e
 
-                os.remove(tmp_fname)
-                entry.mark_as_complete()
+    with log_before_and_after('handling: {0}'.format(queue_name)):
+        partitions = backend.partitions(queue_name)
+        workers = max(1, min(workers, len(partitions)))
+        if workers == 1:
+            errors = [process(partition) for partition in partitions]
+        else:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(workers)
+            try:
+                errors = pool.map(_closing_db_connection(process),
+                                  partitions)
+            finally:
+                pool.close()
+                pool.join()
+    for error in errors:
+        if error is not None:
+            raise error
+
+
+def _closing_db_connection(fn):
+    """Wrap fn to close the calling thread's database connection after."""
+    def wrapped(*args):
+        try:
+            return fn(*args)
+        finally:
+            connection.close()
+    return wrapped
+
+
+def _process_s3_partition(backend, queue_name, partition, s3_account, run,
+                          decrypt, use_mmap, scratch):
+    for entry in backend.pending(queue_name, partition):
+        if not backend.claim(entry):
+            # another worker is on it, leave the rest to keep order.
+            return
+        try:
+            with log_before_and_after('handling: {0}'.format(entry)):
+                with _renewing_claim(backend, entry):
+                    done = _process_s3_entry(entry, s3_account, run,
+                                             decrypt, use_mmap, scratch)
+        except Exception:
+            backend.release(entry)
+            raise
+        if not done:
+            backend.release(entry)
+            return
+        _complete(backend, entry)
+
+
+def _profiled(processor_fn, mode, memory, name):
+    """Wrap processor_fn to record an EntryProfile per call."""
+    if mode not in PROFILE_MODES:
+        raise ValueError('unknown profile mode: {0}'.format(mode))
+    if name is None:
+        name = '{0}.{1}'.format(processor_fn.__module__,
+                                processor_fn.__name__)
+    queues = {}
+
+    def profiled(arg, entry, input_bytes):
+        time_started = datetime.datetime.utcnow()
+        result = None
+        failed = True
+        try:
+            with profiling(mode, memory) as stats:
+                result = processor_fn(arg)
+            failed = False
+            return result
+        finally:
+            # recorded for failures too, they're often the slow ones.
+            _record_profile(queues, entry, name, time_started, stats,
+                            input_bytes, result, failed)
+    return profiled
+
+
+def _record_profile(queues, entry, name, time_started, stats, input_bytes,
+                    result, failed):
+    rows = None
+    if isinstance(result, int) and not isinstance(result, bool):
+        rows = result
+    try:
+        if entry.queue not in queues:
+            queues[entry.queue], _ = Queue.objects.get_or_create(
+                name=entry.queue)
+        EntryProfile.objects.create(queue=queues[entry.queue],
+                                    key=entry.key,
+                                    processor=name,
+                                    time_started=time_started,
+                                    duration=stats['duration'],
+                                    input_bytes=input_bytes,
+                                    rows=rows,
+                                    peak_memory=stats['peak_memory'],
+                                    profile=stats['profile'],
+                                    failed=failed)
+    except Exception:
+        # never hide the processor's own exception, or fail a good run.
+        logger.exception('cannot record profile: {0}'.format(entry))
+
+
+def _process_s3_entry(entry, s3_account, run, decrypt, use_mmap, scratch):
+    """
+    Download, decrypt and process entry, returns False if it couldn't be
+    fetched. Entries are processed in order, so a download failure stops
+    the partition (but not the run) until next time.
+    """
+    base = os.path.basename(entry.key)
+    s3 = get_transport('s3')
+    try:
+        size = _s3_call(s3_account,
+                        lambda bucket: s3.key_size(bucket, entry.key))
+    except Exception:
+        logger.exception('cannot fetch: {0}'.format(entry))
+        return False
+    # room for the download plus its decrypted copy.
+    size = size * 2 if decrypt else size
+    with scratch.tempfile(suffix=base, size=size) as tmp_fname:
+        try:
+            _s3_call(s3_account,
+                     lambda bucket: s3.download(bucket, entry.key, tmp_fname))
+        except Exception:
+            logger.exception('cannot fetch: {0}'.format(entry))
+            return False
+
+        if decrypt:
+            tmp_fname = get_transport('gpg').decrypt(tmp_fname,
+                                                     delete_original=True)
+        input_bytes = os.path.getsize(tmp_fname)
+        if use_mmap:
+            with mapped_file(tmp_fname) as buf:
+                run(buf, entry, input_bytes)
+        else:
+            run(tmp_fname, entry, input_bytes)
+    return True
 
 
 class IMAP_S3_CSV_Processor(Processor):
@@ -264,17 +737,18 @@ class IMAP_S3_CSV_Processor(Processor):
                                       file_regex=cls.IMAP_FILE_REGEX,
                                       s3_account=cls.S3_ACCOUNT,
                                       s3_directory=cls.S3_DIRECTORY,
+                                      key_layout=cls.S3_KEY_LAYOUT,
                                       imap_archive_mbox=cls.IMAP_ARCHIVE_MBOX,
                                       compress=cls.COMPRESS_FILE,
-                                      gpg_recipient=gpg_recipient)
+                                      gpg_recipient=gpg_recipient,
+                                      partition_fn=cls.partition_key)
 
 
 def enqueue_imap_emails(queue_name, imap_account, mailbox, file_regex):
     """Queue each email in mailbox for their attachments to be uploaded"""
-    imap_account.open_connection()
-    uid_validity = imap_account.uid_validity(mailbox)
-    uids = imap_account.list_uids(mailbox)
-    imap_account.close_connection()
+    uid_validity, uids = _imap_call(
+        imap_account,
+        lambda imap: (imap.uid_validity(mailbox), imap.list_uids(mailbox)))
     keys = []
     for uid in uids:
         imap_relative_url = '{0};UID={1}/;UIDVALIDITY={2}'.format(mailbox,
@@ -288,55 +762,81 @@ def send_imap_attachments_into_s3(imap_queue, s3_queue, imap_account,
                                   file_regex,
                                   s3_account, s3_directory,
                                   imap_archive_mbox=None, compress=True,
-                                  gpg_recipient=None):
-    """For each email, upload matching attachments into s3"""
-    upload_q, _ = Queue.objects.get_or_create(name=imap_queue)
-    entries = QueueEntry.objects.filter(queue=upload_q, is_complete=False)
-    for entry in entries:
-        with log_before_and_after('handling: {0}'.format(entry)):
-            s3_keys = _put_imap_attachments_on_s3(entry.key, s3_account,
-                                                  s3_directory,
-                                                  imap_account,
-                                                  file_regex,
-                                                  imap_archive_mbox,
-                                                  compress=compress,
-                                                  gpg_recipient=gpg_recipient)
-            _add_keys_to_process_queue(s3_keys, s3_queue)
-            entry.mark_as_complete()
+                                  gpg_recipient=None, key_layout=None,
+                                  partition_fn=None):
+    """
+    For each email, upload matching attachments into s3. With
+    imap_archive_mbox the emails (and any left by earlier runs) are moved
+    there in bulk once the queue is worked through, see near_queue.cleanup.
+    """
+    if imap_archive_mbox:
+        # an account the moves can't be recorded for fails before anything
+        # is uploaded.
+        endpoint_name('imap', imap_account)
+
+    def handle(entry):
+        s3_keys = _put_imap_attachments_on_s3(entry.key, s3_account,
+                                              s3_directory,
+                                              imap_account,
+                                              file_regex,
+                                              imap_archive_mbox,
+                                              compress=compress,
+                                              gpg_recipient=gpg_recipient,
+                                              key_layout=key_layout)
+        _add_keys_to_process_queue(s3_keys, s3_queue, key_layout,
+                                   partition_fn)
+    _handle_entries(imap_queue, handle)
+    if imap_archive_mbox:
+        from near_queue.cleanup import apply_cleanups
+        apply_cleanups(imap_accounts=[imap_account])
 
 
 def _put_imap_attachments_on_s3(imap_url, s3_account, s3_directory,
                                 imap_account, file_regex,
                                 imap_archive_mbox=None, compress=True,
-                                gpg_recipient=None):
+                                gpg_recipient=None, key_layout=None):
+    if imap_archive_mbox:
+        endpoint = endpoint_name('imap', imap_account)
     imap_details = parse_imap_url(imap_url)
-    imap_account.open_connection()
-    attachmnts = imap_account.download_attachments(imap_details['mailbox'],
-                                                   imap_details['UID'],
-                                                   imap_details['UIDVALIDITY'],
-                                                   filename_regex=file_regex)
-    imap_account.close_connection()
+    attachmnts = _imap_call(imap_account, lambda imap: (
+        imap.download_attachments(imap_details['mailbox'],
+                                  imap_details['UID'],
+                                  imap_details['UIDVALIDITY'],
+                                  filename_regex=file_regex)))
 
+    key_layout = get_key_layout(key_layout)
     keys = {}
     for attach in attachmnts:
         remote_key = '{0}_{1}'.format(attach['utc_date'].isoformat(),
                                       attach['remote_fname'])
-        s3_key = os.path.join(s3_directory, remote_key)
+        s3_key = key_layout.key(s3_directory, remote_key,
+                                when=attach['utc_date'])
         keys[attach['local_fname']] = s3_key
 
     s3_keys = []
-    for localpath, s3_key in keys.iteritems():
-        s3_location = _put_on_s3(localpath, s3_key, s3_account, compress,
-                                 gpg_recipient)
-        os.remove(localpath)
-        s3_keys.append(s3_location)
+    scratch = get_scratch_space()
+    try:
+        for localpath, s3_key in keys.items():
+            # room for the attachment plus its .gz and .gpg copies.
+            size = os.path.getsize(localpath) * (
+                1 + bool(compress) + (gpg_recipient is not None))
+            with scratch.tempfile(suffix=os.path.basename(localpath),
+                                  size=size) as tempfile:
+                shutil.move(localpath, tempfile)
+                s3_keys.append(_put_on_s3(tempfile, s3_key, s3_account,
+                                          compress, gpg_recipient))
+    finally:
+        # whatever is left if an upload failed, downloaded again next time.
+        for localpath in keys:
+            if os.path.exists(localpath):
+                os.remove(localpath)
     if imap_archive_mbox:
-        imap_account.open_connection()
-        imap_account.move(imap_details['mailbox'],
-                          imap_details['UID'],
-                          imap_details['UIDVALIDITY'],
-                          imap_archive_mbox)
-        imap_account.close_connection()
+        # moved along with the rest by send_imap_attachments_into_s3.
+        PendingCleanup.record_imap_move(endpoint,
+                                        imap_details['mailbox'],
+                                        imap_details['UID'],
+                                        imap_details['UIDVALIDITY'],
+                                        imap_archive_mbox)
     return s3_keys
 
 
@@ -0,0 +1,122 @@
+"""
+Opt-in profiling of processor calls.
+
+Modes:
+'timing': wall clock duration only
+'cprofile': plus the top functions by cumulative time, from cProfile
+'sample': plus the hottest lines, from sampling the calling thread's stack
+every SAMPLE_INTERVAL seconds (much cheaper than cProfile on busy code)
+
+Peak python memory (tracemalloc, python 3.4+) is measured on request, it
+slows the call down noticeably.
+
+The profilers are imported only when used, keeping processor start up fast.
+"""
+import collections
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+MODES = ('timing', 'cprofile', 'sample')
+SAMPLE_INTERVAL = 0.005
+TOP_N = 30
+
+
+class _Sampler(threading.Thread):
+
+    def __init__(self, thread_id, interval):
+        super(_Sampler, self).__init__()
+        self.daemon = True
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = collections.Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            code = frame.f_code
+            self.counts['{0}:{1} {2}'.format(code.co_filename, frame.f_lineno,
+                                             code.co_name)] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def report(self):
+        lines = ['{0} samples every {1}s'.format(self.samples, self.interval)]
+        for location, count in self.counts.most_common(TOP_N):
+            lines.append('{0:6d} {1}'.format(count, location))
+        return '\n'.join(lines)
+
+
+def _cprofile_report(profiler):
+    import pstats
+    try:
+        from cStringIO import StringIO
+    except ImportError:
+        from io import StringIO
+    out = StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats('cumulative').print_stats(TOP_N)
+    return out.getvalue()
+
+
+@contextmanager
+def profiling(mode='timing', memory=False):
+    """
+    Profile the with block. Yields a dict that is filled in on exit, even
+    if the block raises, with duration (seconds), peak_memory (bytes or
+    None) and profile (report text).
+    """
+    if mode not in MODES:
+        raise ValueError('unknown profile mode: {0}'.format(mode))
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+    track_memory = memory and tracemalloc is not None
+    started_tracing = False
+    if track_memory:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        elif hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+    profiler = sampler = None
+    if mode == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+    elif mode == 'sample':
+        sampler = _Sampler(threading.current_thread().ident, SAMPLE_INTERVAL)
+        sampler.start()
+
+    stats = {}
+    start = time.time()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield stats
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        stats['duration'] = time.time() - start
+        if sampler is not None:
+            sampler.stop()
+        stats['peak_memory'] = None
+        if track_memory:
+            stats['peak_memory'] = tracemalloc.get_traced_memory()[1]
+            if started_tracing:
+                tracemalloc.stop()
+        stats['profile'] = ''
+        if profiler is not None:
+            stats['profile'] = _cprofile_report(profiler)
+        elif sampler is not None:
+            stats['profile'] = sampler.report()
@@ -0,0 +1,74 @@
+"""
+Compare a process queue against what is actually on S3, and rebuild it.
+
+Listing is split by the queue's key layout into many prefixes which are
+listed concurrently, each on its own connection.
+"""
+import logging
+
+from multiprocessing.pool import ThreadPool
+
+from near_queue.backends import get_backend
+from near_queue.keylayout import get_key_layout
+from near_queue.processors import _s3_call
+from near_queue.transports import get_transport
+
+
+logger = logging.getLogger(__name__.split('.')[0])
+
+
+def list_s3_keys(s3_account, s3_directory, key_layout=None, since=None,
+                 workers=8):
+    """Every key under s3_directory, as a set."""
+    key_layout = get_key_layout(key_layout)
+    prefixes = _s3_call(s3_account, lambda bucket: key_layout.prefixes(
+        bucket, s3_directory, since=since))
+
+    s3 = get_transport('s3')
+
+    def list_prefix(prefix):
+        return _s3_call(s3_account,
+                        lambda bucket: s3.list_keys(bucket, prefix))
+
+    logger.info('listing {0} prefixes under {1}'.format(len(prefixes),
+                                                        s3_directory))
+    pool = ThreadPool(max(1, min(workers, len(prefixes))))
+    try:
+        listings = pool.map(list_prefix, prefixes)
+    finally:
+        pool.close()
+        pool.join()
+    return set(key for listing in listings for key in listing)
+
+
+def reconcile(queue_name, s3_account, s3_directory, key_layout=None,
+              since=None, workers=8):
+    """
+    Returns (keys on S3 but not queued, keys queued but not on S3).
+
+    With since (date layout only) S3 is only listed from that day on, so
+    the second set will include older entries.
+    """
+    s3_keys = list_s3_keys(s3_account, s3_directory, key_layout, since,
+                           workers)
+    queued = set(get_backend().keys(queue_name))
+    return s3_keys - queued, queued - s3_keys
+
+
+def rebuild_process_queue(queue_name, s3_account, s3_directory,
+                          key_layout=None, since=None, workers=8,
+                          dry_run=False, partition_fn=None):
+    """
+    Queue (as pending) every key on S3 missing from queue_name, returns the
+    missing keys. Existing entries are left as they are.
+    """
+    key_layout = get_key_layout(key_layout)
+    missing, _ = reconcile(queue_name, s3_account, s3_directory, key_layout,
+                           since, workers)
+    missing = sorted(missing, key=key_layout.sort_key)
+    logger.info('{0} keys missing from {1}'.format(len(missing), queue_name))
+    if not dry_run:
+        get_backend().enqueue(queue_name, missing,
+                              sort_key_fn=key_layout.sort_key,
+                              partition_fn=partition_fn)
+    return missing
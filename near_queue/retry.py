@@ -0,0 +1,190 @@
+"""
+Retry with jittered exponential backoff, and a circuit breaker per remote
+endpoint (SFTP/IMAP host, S3 bucket).
+
+Only transient errors (dropped connections, timeouts, 5xx responses) are
+retried or counted against an endpoint's breaker, anything else is raised
+straight away. Once an endpoint has failed failure_threshold times in a
+row its breaker opens and calls fail fast with CircuitOpen until
+reset_timeout has passed, after which a single trial call is let through.
+
+Settings (all optional):
+NEAR_QUEUE_RETRY_ATTEMPTS = 3
+NEAR_QUEUE_RETRY_BASE_DELAY = 1.0 (seconds)
+NEAR_QUEUE_RETRY_MAX_DELAY = 30.0 (seconds)
+NEAR_QUEUE_BREAKER_THRESHOLD = 5
+NEAR_QUEUE_BREAKER_RESET_TIMEOUT = 60.0 (seconds)
+"""
+import errno
+import logging
+import random
+import socket
+import sys
+import threading
+import time
+
+
+logger = logging.getLogger(__name__.split('.')[0])
+
+TRANSIENT_ERRNOS = frozenset([
+    errno.ECONNABORTED,
+    errno.ECONNREFUSED,
+    errno.ECONNRESET,
+    errno.EHOSTUNREACH,
+    errno.ENETDOWN,
+    errno.ENETUNREACH,
+    errno.EPIPE,
+    errno.ETIMEDOUT,
+])
+
+# transport libraries we don't import directly (paramiko via rowdy),
+# matched by class name.
+TRANSIENT_EXCEPTION_NAMES = frozenset([
+    'SSHException',
+    'NoValidConnectionsError',
+])
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+def _setting(name, default):
+    from django.conf import settings
+    return getattr(settings, name, default)
+
+
+def is_transient(exc):
+    """Is exc worth retrying, i.e. likely to succeed if tried again."""
+    if isinstance(exc, (socket.timeout, EOFError)):
+        return True
+    # not importing imaplib ourselves, if it isn't loaded exc isn't from it.
+    imaplib = sys.modules.get('imaplib')
+    if imaplib is not None and isinstance(exc, imaplib.IMAP4.abort):
+        return True
+    if type(exc).__name__ in TRANSIENT_EXCEPTION_NAMES:
+        return True
+    status = getattr(exc, 'status', None)  # boto S3ResponseError and co.
+    if isinstance(status, int):
+        return status >= 500 or status in (408, 429)
+    if isinstance(exc, EnvironmentError):
+        return exc.errno in TRANSIENT_ERRNOS
+    return False
+
+
+class CircuitBreaker(object):
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.time() - self.opened_at >= self.reset_timeout:
+                # half open, let one trial call through.
+                self.opened_at = time.time()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info('circuit closed: {0}'.format(self.name))
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning('circuit opened: {0}'.format(self.name))
+                self.opened_at = time.time()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(endpoint):
+    with _breakers_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(
+                endpoint,
+                failure_threshold=_setting('NEAR_QUEUE_BREAKER_THRESHOLD', 5),
+                reset_timeout=_setting('NEAR_QUEUE_BREAKER_RESET_TIMEOUT',
+                                       60.0))
+        return _breakers[endpoint]
+
+
+def call_with_retry(fn, endpoint, attempts=None):
+    """
+    Call fn(), retrying transient failures with full-jitter exponential
+    backoff. Raises CircuitOpen without calling fn if endpoint is down.
+    """
+    if attempts is None:
+        attempts = _setting('NEAR_QUEUE_RETRY_ATTEMPTS', 3)
+    base_delay = _setting('NEAR_QUEUE_RETRY_BASE_DELAY', 1.0)
+    max_delay = _setting('NEAR_QUEUE_RETRY_MAX_DELAY', 30.0)
+    breaker = get_breaker(endpoint)
+    for attempt in range(attempts):
+        if not breaker.allow():
+            raise CircuitOpen(endpoint)
+        try:
+            result = fn()
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            breaker.record_failure()
+            if attempt == attempts - 1:
+                raise
+            cap = min(max_delay, base_delay * 2 ** attempt)
+            delay = random.uniform(0, cap)
+            logger.warning('{0} failed ({1!r}), retrying in {2:.1f}s'.format(
+                endpoint, e, delay))
+            time.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+
+
+def endpoint_name(scheme, account):
+    """
+    Lasting name of the server account connects to, e.g. sftp://user@host
+    or s3://host/bucket, as kept in queue keys and PendingCleanup rows. An
+    account without a hostname or host can give its own as endpoint.
+    """
+    endpoint = getattr(account, 'endpoint', None)
+    if endpoint:
+        return endpoint
+    if scheme == 's3':
+        return 's3://{0}/{1}'.format(account.host, account.bucket)
+    host = getattr(account, 'hostname', None) or getattr(account, 'host',
+                                                         None)
+    if host is None:
+        raise ValueError('cannot name the {0} server of {1!r}, give it a '
+                         'hostname, host or endpoint'.format(scheme,
+                                                             account))
+    user = getattr(account, 'username', None)
+    if user:
+        return '{0}://{1}@{2}'.format(scheme, user, host)
+    return '{0}://{1}'.format(scheme, host)
+
+
+def breaker_name(scheme, account):
+    """Breaker key for account, its endpoint_name if it has one."""
+    try:
+        return endpoint_name(scheme, account)
+    except ValueError:
+        # breakers only last as long as the process.
+        return '{0}://{1:x}'.format(scheme, id(account))
@@ -0,0 +1,213 @@
+"""
+Managed scratch space for downloaded/derived temp files.
+
+Every temp file lives in its own directory under a shared scratch root, so
+sibling files made from it (.gz, .gpg, decrypted output) are cleaned up
+along with it. Total usage of the root, including files belonging to other
+processes, is kept under a byte budget; callers block until there is room.
+
+Each directory records its reservation in a RESERVED_FILE, and admission
+holds an flock on LOCK_FILE, so processes sharing a root see each other's
+reservations before any bytes are written.
+
+Settings (all optional):
+NEAR_QUEUE_SCRATCH_DIR = tempfile.gettempdir()/near_queue
+NEAR_QUEUE_SCRATCH_BUDGET = None (bytes, None for unlimited)
+NEAR_QUEUE_SCRATCH_TIMEOUT = None (seconds to wait for room, None forever)
+NEAR_QUEUE_SCRATCH_DEFAULT_RESERVATION = 64MB (for files of unknown size)
+"""
+import errno
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+logger = logging.getLogger(__name__.split('.')[0])
+
+DEFAULT_RESERVATION = 64 * 1024 * 1024
+RESERVED_FILE = '.reserved'
+LOCK_FILE = '.lock'
+
+_ENTRY_RE = re.compile(r'^nq-(\d+)-')
+
+
+class ScratchSpaceExhausted(Exception):
+    pass
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def _dir_size(path):
+    total = 0
+    for dirpath, _, fnames in os.walk(path):
+        for fname in fnames:
+            if dirpath == path and fname == RESERVED_FILE:
+                continue
+            try:
+                total += os.path.getsize(os.path.join(dirpath, fname))
+            except OSError:
+                pass  # removed while we were looking
+    return total
+
+
+class ScratchSpace(object):
+
+    def __init__(self, root=None, budget=None, timeout=None,
+                 default_reservation=DEFAULT_RESERVATION, poll_interval=1.0):
+        if root is None:
+            root = os.path.join(tempfile.gettempdir(), 'near_queue')
+        self.root = root
+        self.budget = budget
+        self.timeout = timeout
+        self.default_reservation = default_reservation
+        self.poll_interval = poll_interval
+        self._cond = threading.Condition()
+        try:
+            os.makedirs(root)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def _entries(self):
+        for name in os.listdir(self.root):
+            m = _ENTRY_RE.match(name)
+            if m:
+                yield os.path.join(self.root, name), int(m.group(1))
+
+    @staticmethod
+    def _reserved(path):
+        try:
+            with open(os.path.join(path, RESERVED_FILE)) as f:
+                return int(f.read() or 0)
+        except (IOError, OSError, ValueError):
+            return 0  # removed, or not written yet
+
+    def usage(self):
+        """
+        Bytes in use under root, counting every process's reservations in
+        full.
+        """
+        total = 0
+        for path, _ in self._entries():
+            total += max(_dir_size(path), self._reserved(path))
+        return total
+
+    @contextmanager
+    def _locked(self):
+        """Hold the root's lock, serializing admission across processes."""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.root, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def _try_admit(self, nbytes):
+        """The new directory, or None and the usage when there's no room."""
+        with self._locked():
+            used = self.usage()
+            # an oversized request is let through once nothing else is in
+            # flight, otherwise it could never be admitted.
+            if self.budget is not None and used + nbytes > self.budget and \
+                    used != 0:
+                return None, used
+            path = tempfile.mkdtemp(prefix='nq-{0}-'.format(os.getpid()),
+                                    dir=self.root)
+            with open(os.path.join(path, RESERVED_FILE), 'w') as f:
+                f.write(str(nbytes))
+            return path, used
+
+    def sweep(self):
+        """Remove scratch directories left behind by dead processes."""
+        removed = 0
+        for path, pid in self._entries():
+            if pid != os.getpid() and not _pid_alive(pid):
+                logger.info('removing orphaned scratch: {0}'.format(path))
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        return removed
+
+    def _admit(self, nbytes):
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.time() + self.timeout
+        with self._cond:
+            while True:
+                path, used = self._try_admit(nbytes)
+                if path is not None:
+                    return path
+                if deadline is not None and time.time() >= deadline:
+                    raise ScratchSpaceExhausted(
+                        'need {0} bytes, {1} of {2} in use under {3}'.format(
+                            nbytes, used, self.budget, self.root))
+                logger.info('waiting for scratch space ({0} bytes)'.format(
+                    nbytes))
+                # other processes don't notify us, so poll as well.
+                self._cond.wait(self.poll_interval)
+
+    def _release(self, path):
+        shutil.rmtree(path, ignore_errors=True)
+        with self._cond:
+            self._cond.notify_all()
+
+    @contextmanager
+    def tempfile(self, suffix='', size=None):
+        """
+        Yield the path of a new empty file, removed along with any siblings
+        (e.g. path + '.gz') on exit.
+
+        size is the number of bytes to reserve against the budget, include
+        room for any compressed/encrypted/decrypted copies.
+        """
+        if size is None:
+            size = self.default_reservation
+        path = self._admit(size)
+        try:
+            fd, fname = tempfile.mkstemp(suffix=suffix, dir=path)
+            os.close(fd)
+            yield fname
+        finally:
+            self._release(path)
+
+
+_scratch_space = None
+_scratch_lock = threading.Lock()
+
+
+def get_scratch_space():
+    """The process wide ScratchSpace, swept of orphans on first use."""
+    global _scratch_space
+    with _scratch_lock:
+        if _scratch_space is None:
+            from django.conf import settings
+            reservation = getattr(settings,
+                                  'NEAR_QUEUE_SCRATCH_DEFAULT_RESERVATION',
+                                  DEFAULT_RESERVATION)
+            space = ScratchSpace(
+                root=getattr(settings, 'NEAR_QUEUE_SCRATCH_DIR', None),
+                budget=getattr(settings, 'NEAR_QUEUE_SCRATCH_BUDGET', None),
+                timeout=getattr(settings, 'NEAR_QUEUE_SCRATCH_TIMEOUT', None),
+                default_reservation=reservation)
+            space.sweep()
+            _scratch_space = space
+        return _scratch_space
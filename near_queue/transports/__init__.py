@@ -0,0 +1,47 @@
+"""
+Remote transport backends, each imported on first use.
+
+Processes that only touch one transport (or only the models/admin) never
+pay for importing boto, rowdy/paramiko etc. A backend is any module (or
+object) providing the functions the built-in one does, and can be swapped
+with register().
+"""
+import importlib
+import threading
+
+try:
+    string_types = basestring  # noqa
+except NameError:
+    string_types = str
+
+
+TRANSPORTS = {
+    's3': 'near_queue.transports.s3',
+    'sftp': 'near_queue.transports.sftp',
+    'imap': 'near_queue.transports.imap',
+    'gpg': 'near_queue.transports.gpg',
+}
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def register(name, backend):
+    """backend is a dotted module path, or an already loaded module/object"""
+    with _lock:
+        _loaded.pop(name, None)
+        TRANSPORTS[name] = backend
+
+
+def get_transport(name):
+    try:
+        return _loaded[name]
+    except KeyError:
+        pass
+    with _lock:
+        if name not in _loaded:
+            backend = TRANSPORTS[name]
+            if isinstance(backend, string_types):
+                backend = importlib.import_module(backend)
+            _loaded[name] = backend
+        return _loaded[name]
@@ -0,0 +1,2 @@
+from near_queue.utils import gpg_decrypt as decrypt  # noqa
+from near_queue.utils import gpg_encrypt as encrypt  # noqa
@@ -0,0 +1,82 @@
+import imaplib
+
+
+def connect(imap_account):
+    """
+    IMAP accounts (IMAPConnection) are their own connection, with
+    open_connection/close_connection.
+    """
+    return imap_account
+
+
+def _imaplib_client(imap):
+    for client in (imap, getattr(imap, 'client', None),
+                   getattr(imap, 'imap', None)):
+        if isinstance(client, imaplib.IMAP4):
+            return client
+    return None
+
+
+def move_messages(imap, mailbox, uids, uid_validity, archive_mbox):
+    """
+    Move uids from mailbox to archive_mbox on an open connection, all at
+    once where possible.
+
+    Accounts providing move_messages (with this signature) are left to it,
+    accounts that are, or expose as client or imap, an imaplib client the
+    server can uid_move with are moved that way. Otherwise each is moved
+    with move, still over the one connection.
+    """
+    move_many = getattr(imap, 'move_messages', None)
+    if move_many is not None:
+        return move_many(mailbox, uids, uid_validity, archive_mbox)
+    client = _imaplib_client(imap)
+    if client is not None and (_can_uid_move(client) or
+                               not hasattr(imap, 'move')):
+        return uid_move(client, mailbox, uids, uid_validity, archive_mbox)
+    for uid in uids:
+        imap.move(mailbox, uid, uid_validity, archive_mbox)
+
+
+def _quote(mailbox):
+    return '"{0}"'.format(mailbox.replace('\\', '\\\\').replace('"', '\\"'))
+
+
+def _check(response):
+    typ, data = response
+    if typ != 'OK':
+        raise imaplib.IMAP4.error('{0} {1!r}'.format(typ, data))
+    return data
+
+
+def _can_uid_move(client):
+    capabilities = client.capabilities
+    return 'UIDPLUS' in capabilities or ('MOVE' in capabilities and
+                                         'MOVE' in imaplib.Commands)
+
+
+def uid_move(client, mailbox, uids, uid_validity, archive_mbox):
+    """
+    Move uids from mailbox to archive_mbox with an imaplib client, as one
+    UID MOVE (RFC 6851) or else UID COPY, flag deleted and UID EXPUNGE
+    (RFC 4315). Servers with neither are refused, as a plain EXPUNGE would
+    also remove anything else already flagged deleted in mailbox.
+    """
+    if not _can_uid_move(client):
+        raise imaplib.IMAP4.error('server supports neither MOVE nor '
+                                  'UIDPLUS, not moving from {0}'.format(
+                                      mailbox))
+    _check(client.select(_quote(mailbox)))
+    _, current = client.response('UIDVALIDITY')
+    if not current or int(current[0]) != int(uid_validity):
+        raise imaplib.IMAP4.error('UIDVALIDITY of {0} is now {1!r}, not '
+                                  '{2}'.format(mailbox, current,
+                                               uid_validity))
+    uid_set = ','.join(str(uid) for uid in sorted(uids))
+    capabilities = client.capabilities
+    if 'MOVE' in capabilities and 'MOVE' in imaplib.Commands:
+        _check(client.uid('MOVE', uid_set, _quote(archive_mbox)))
+        return
+    _check(client.uid('COPY', uid_set, _quote(archive_mbox)))
+    _check(client.uid('STORE', uid_set, '+FLAGS.SILENT', '(\\Deleted)'))
+    _check(client.uid('EXPUNGE', uid_set))
@@ -0,0 +1,34 @@
+from boto.s3.connection import S3Connection
+from boto.s3.key import Key
+
+
+def get_bucket(s3_account):
+    conn = S3Connection(aws_access_key_id=s3_account.access_key,
+                        aws_secret_access_key=s3_account.secret_key,
+                        host=s3_account.host)
+    return conn.get_bucket(s3_account.bucket)
+
+
+def key_size(bucket, name):
+    k = bucket.get_key(name)
+    if k is None:
+        raise IOError('not on s3: {0}'.format(name))
+    return k.size
+
+
+def download(bucket, name, fname):
+    Key(bucket, name=name).get_contents_to_filename(fname)
+
+
+def upload(bucket, name, fname):
+    Key(bucket, name=name).set_contents_from_filename(fname)
+
+
+def list_keys(bucket, prefix):
+    return [k.name for k in bucket.list(prefix=prefix)]
+
+
+def list_prefixes(bucket, prefix):
+    """The 'sub-folders' directly under prefix."""
+    return [p.name for p in bucket.list(prefix=prefix, delimiter='/')
+            if p.name.endswith('/')]
@@ -0,0 +1,50 @@
+import posixpath
+import stat
+
+
+def connect(sftp_account):
+    """An unopened connection, with open_connection/close_connection."""
+    # imported here rather than above so the listing helpers below work
+    # on any connection, rowdy or not.
+    import rowdy.sftp
+    return rowdy.sftp.SFTPConnection(sftp_account.username,
+                                     sftp_account.password,
+                                     sftp_account.hostname)
+
+
+def file_size(sftp, path):
+    """Size of path in bytes, None if the connection can't stat."""
+    stat_path = getattr(sftp, 'stat', None)
+    if stat_path is None:
+        return None
+    return stat_path(path).st_size
+
+
+def list_folder(sftp, folder, find_folders=True):
+    """
+    (name, is_folder) for each entry of folder, from listdir_attr where
+    the connection has it. Otherwise from listdir, then (if find_folders)
+    is_folder of each entry; else is_folder is None, for the caller to
+    find out with is_folder only for the entries it wants.
+    """
+    listdir_attr = getattr(sftp, 'listdir_attr', None)
+    if listdir_attr is not None:
+        return [(attr.filename, stat.S_ISDIR(attr.st_mode))
+                for attr in listdir_attr(folder)]
+    names = sftp.listdir(folder)
+    if not find_folders:
+        return [(name, None) for name in names]
+    return [(name, is_folder(sftp, posixpath.join(folder, name)))
+            for name in names]
+
+
+def is_folder(sftp, path):
+    """From a stat of path, or failing that whether it can be listed."""
+    stat_path = getattr(sftp, 'stat', None)
+    if stat_path is not None:
+        return stat.S_ISDIR(stat_path(path).st_mode)
+    try:
+        sftp.listdir(path)
+    except (IOError, OSError):
+        return False
+    return True
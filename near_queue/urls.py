@@ -0,0 +1,8 @@
+from django.conf.urls import url
+
+from . import views
+
+
+urlpatterns = [
+    url(r'^stats/$', views.queue_stats, name='near_queue_stats'),
+]
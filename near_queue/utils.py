@@ -1,5 +1,15 @@
 import gzip
+import logging
+import mmap
 import os
+import re
+
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__.split('.')[0])
+
+_LINE_END = re.compile(br'\r?\n')
 
 
 def gzip_file(fname):
@@ -37,3 +47,62 @@ def gpg_decrypt(fname, delete_original=False):
         os.remove(fname)
 
     return gpg_fname
+
+
+@contextmanager
+def mapped_file(fname):
+    """
+    Yield a read-only memoryview over fname, backed by mmap.
+
+    Nothing is read into python memory up front, pages are faulted in from
+    the page cache as they are touched. Views (and slices of them) must not
+    be used once the with block has exited.
+    """
+    with open(fname, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # mmap refuses to map empty files.
+            yield _readonly_view(b'')
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = _readonly_view(mapped)
+        try:
+            yield view
+        finally:
+            if hasattr(view, 'release'):
+                view.release()
+            try:
+                mapped.close()
+            except BufferError:
+                # processor kept hold of a slice, let gc unmap it later.
+                logger.warning('slices of {0} still referenced, '
+                               'leaving mmap open'.format(fname))
+
+
+def _readonly_view(obj):
+    try:
+        # python 2: re can't search a memoryview, and mmap only speaks the
+        # old buffer protocol.
+        return buffer(obj)  # noqa
+    except NameError:
+        return memoryview(obj)
+
+
+def iter_csv_lines(buf):
+    """
+    Split buf into lines without copying, yielding memoryview slices.
+
+    Line endings (\\n or \\r\\n) are stripped. Quoted CSV fields containing
+    newlines are not recognised, each physical line is yielded separately.
+    """
+    view = _readonly_view(buf)
+
+    def cut(start, end):
+        if isinstance(view, memoryview):
+            return view[start:end]
+        return buffer(view, start, end - start)  # noqa
+    start = 0
+    for match in _LINE_END.finditer(view):
+        yield cut(start, match.start())
+        start = match.end()
+    if start < len(view):
+        yield cut(start, len(view))
@@ -0,0 +1,25 @@
+import json
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse
+
+from .models import QueueStats
+
+
+@staff_member_required
+def queue_stats(request):
+    """
+    Counters, oldest pending age and hourly throughput for every queue.
+
+    Optional ?queue=name to restrict to one queue, ?hours=N for the
+    throughput window (default 24).
+    """
+    stats = QueueStats.objects.select_related('queue')
+    if 'queue' in request.GET:
+        stats = stats.filter(queue__name=request.GET['queue'])
+    try:
+        hours = int(request.GET.get('hours', 24))
+    except ValueError:
+        hours = 24
+    data = [s.summary(hours=hours) for s in stats]
+    return HttpResponse(json.dumps(data), content_type='application/json')
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_backends
+------------
+
+Tests for the queue backends in `near_queue.backends`.
+
+The Redis tests run against NEAR_QUEUE_TEST_REDIS_URL (default
+redis://localhost:6379/15), and are skipped when it can't be reached.
+"""
+
+import datetime
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import uuid
+
+from django.db import transaction
+from django.test import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from near_queue import models
+from near_queue.backends import MirroredBackend
+from near_queue.backends import redis as redis_backend
+from near_queue.backends.orm import DjangoBackend
+from near_queue.backends.sqlite import SQLiteBackend
+
+
+class BackendTests(object):
+
+    def pending_keys(self, queue='q'):
+        return [e.key for e in self.backend.pending(queue)]
+
+    def test_enqueue_ignores_existing_keys(self):
+        self.assertEqual(self.backend.enqueue('q', ['a', 'b']), 2)
+        self.assertEqual(self.backend.enqueue('q', ['b', 'c']), 1)
+        self.assertEqual(sorted(self.backend.keys('q')), ['a', 'b', 'c'])
+
+    def test_pending_in_sort_key_order(self):
+        self.backend.enqueue('q', ['x/2', 'y/1', 'z/3'],
+                             sort_key_fn=lambda key: key.split('/')[1])
+        self.assertEqual(self.pending_keys(), ['y/1', 'x/2', 'z/3'])
+
+    def test_queues_are_separate(self):
+        self.backend.enqueue('q', ['a'])
+        self.backend.enqueue('other', ['b'])
+        self.assertEqual(self.pending_keys(), ['a'])
+        self.assertEqual(self.pending_keys('other'), ['b'])
+
+    def test_claim_is_exclusive_until_released(self):
+        self.backend.enqueue('q', ['a'])
+        entry = next(iter(self.backend.pending('q')))
+        self.assertTrue(self.backend.claim(entry))
+        self.assertFalse(self.backend.claim(entry))
+        self.backend.release(entry)
+        self.assertTrue(self.backend.claim(entry))
+
+    def test_claim_after_complete_fails(self):
+        self.backend.enqueue('q', ['a'])
+        entry = next(iter(self.backend.pending('q')))
+        self.assertTrue(self.backend.claim(entry))
+        self.backend.complete(entry)
+        self.assertFalse(self.backend.claim(entry))
+
+    def test_renew_only_while_claimed(self):
+        self.backend.enqueue('q', ['a'])
+        entry = next(iter(self.backend.pending('q')))
+        self.assertFalse(self.backend.renew(entry))
+        self.assertTrue(self.backend.claim(entry))
+        self.assertTrue(self.backend.renew(entry))
+        self.assertFalse(self.backend.claim(entry))
+        self.backend.release(entry)
+        self.assertFalse(self.backend.renew(entry))
+
+    def test_only_the_claimant_renews_releases_or_completes(self):
+        self.backend.enqueue('q', ['a'])
+        entry = next(iter(self.backend.pending('q')))
+        other = self.other_backend()
+        self.assertTrue(self.backend.claim(entry))
+        self.assertFalse(other.renew(entry))
+        other.release(entry)
+        self.assertFalse(other.claim(entry))
+        self.assertFalse(other.complete(entry))
+        self.assertEqual(self.pending_keys(), ['a'])
+        self.assertTrue(self.backend.complete(entry))
+        self.assertEqual(self.pending_keys(), [])
+
+    def test_pending_while_completing(self):
+        keys = ['a', 'b', 'c', 'd', 'e']
+        self.backend.enqueue('q', keys, sort_key_fn=lambda key: None
+                             if key in 'ab' else key)
+        seen = []
+        for entry in self.backend.pending('q'):
+            seen.append(entry.key)
+            self.backend.claim(entry)
+            self.backend.complete(entry)
+        self.assertEqual(seen, keys)
+        self.assertEqual(self.pending_keys(), [])
+
+    def test_complete_and_reopen(self):
+        self.backend.enqueue('q', ['a', 'b'])
+        entry = next(iter(self.backend.pending('q')))
+        self.backend.claim(entry)
+        self.backend.complete(entry)
+        self.assertEqual(self.pending_keys(), ['b'])
+        self.backend.enqueue('q', ['a'])
+        self.assertEqual(self.pending_keys(), ['b'])
+        self.backend.enqueue('q', ['a'], reopen=True)
+        self.assertEqual(self.pending_keys(), ['a', 'b'])
+
+    def test_partitions(self):
+        self.backend.enqueue('q', ['a/3', 'b/2', 'a/1', 'c'],
+                             sort_key_fn=lambda key: key[-1],
+                             partition_fn=lambda key: key.split('/')[0]
+                             if '/' in key else None)
+        self.assertEqual(self.backend.partitions('q'), ['', 'a', 'b'])
+        entries = list(self.backend.pending('q', 'a'))
+        self.assertEqual([e.key for e in entries], ['a/1', 'a/3'])
+        self.assertEqual([e.partition for e in entries], ['a', 'a'])
+        self.assertEqual(self.pending_keys(), ['a/1', 'b/2', 'a/3', 'c'])
+        self.assertEqual([e.partition for e in self.backend.pending('q')],
+                         ['a', 'b', 'a', ''])
+
+    def test_completed_partitions_are_not_listed(self):
+        self.backend.enqueue('q', ['a', 'b'], partition_fn=lambda key: key)
+        entry = next(iter(self.backend.pending('q', 'a')))
+        self.backend.claim(entry)
+        self.backend.complete(entry)
+        self.assertEqual(self.backend.partitions('q'), ['b'])
+        self.assertEqual(self.pending_keys(), ['b'])
+
+
+class TestSQLiteBackend(BackendTests, unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'queue.db')
+        self.backend = SQLiteBackend(self.path, batch_size=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def other_backend(self):
+        return SQLiteBackend(self.path)
+
+    def test_no_read_held_between_batches(self):
+        self.backend.enqueue('q', ['a', 'b', 'c'])
+        pending = self.backend.pending('q')
+        next(pending)
+        conn = sqlite3.connect(self.path)
+        busy, _, _ = conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+        conn.close()
+        self.assertEqual(busy, 0)
+        self.assertEqual([e.key for e in pending], ['b', 'c'])
+
+
+class TestRedisBackend(BackendTests, unittest.TestCase):
+
+    def setUp(self):
+        if redis_backend.redis is None:
+            raise unittest.SkipTest('redis package not installed')
+        url = os.environ.get('NEAR_QUEUE_TEST_REDIS_URL',
+                             'redis://localhost:6379/15')
+        client = redis_backend.redis.StrictRedis.from_url(url)
+        try:
+            client.ping()
+        except redis_backend.redis.ConnectionError:
+            raise unittest.SkipTest('no redis server at {0}'.format(url))
+        self.prefix = 'near_queue_test_{0}'.format(uuid.uuid4().hex)
+        self.backend = redis_backend.RedisBackend(
+            prefix=self.prefix, batch_size=2, client=client)
+        self.client = client
+
+    def other_backend(self):
+        return redis_backend.RedisBackend(prefix=self.prefix,
+                                          client=self.client)
+
+    def tearDown(self):
+        keys = self.client.keys(self.prefix + ':*')
+        if keys:
+            self.client.delete(*keys)
+
+
+class TestDjangoBackendRace(TestCase):
+
+    def test_concurrent_enqueue_of_same_keys(self):
+        atomic = transaction.atomic
+        queue = models.Queue.objects.create(name='q')
+        raced = []
+
+        def racing(*args, **kwargs):
+            # another worker queues 'b' between our lookup and insert.
+            if not raced:
+                raced.append('b')
+                models.QueueEntry.objects.create(queue=queue, key='b')
+            return atomic(*args, **kwargs)
+
+        with mock.patch.object(transaction, 'atomic', racing):
+            added = DjangoBackend().enqueue('q', ['a', 'b', 'c'])
+        self.assertEqual(added, 2)
+        self.assertEqual(sorted(DjangoBackend().keys('q')), ['a', 'b', 'c'])
+        self.assertEqual(models.QueueStats.objects.get(queue=queue).pending,
+                         3)
+
+
+class TestDjangoBackend(BackendTests, TestCase):
+
+    def setUp(self):
+        self.backend = DjangoBackend(batch_size=2)
+
+    def other_backend(self):
+        return DjangoBackend()
+
+    def test_claims_counted_in_flight(self):
+        self.backend.enqueue('q', ['a', 'b'])
+        a, b = self.backend.pending('q')
+        self.backend.claim(a)
+        self.backend.claim(b)
+        self.backend.claim(b)
+        stats = models.QueueStats.objects.get(queue__name='q')
+        self.assertEqual((stats.pending, stats.in_flight), (2, 2))
+        self.backend.complete(a)
+        self.backend.release(b)
+        stats = models.QueueStats.objects.get(queue__name='q')
+        self.assertEqual((stats.pending, stats.in_flight, stats.completed),
+                         (1, 0, 1))
+
+    def test_expired_claim_can_be_claimed_again(self):
+        self.backend.enqueue('q', ['a'])
+        entry = next(iter(self.backend.pending('q')))
+        self.backend.claim(entry)
+        models.QueueEntry.objects.update(
+            claimed_until=datetime.datetime.utcnow() -
+            datetime.timedelta(seconds=1))
+        self.assertTrue(self.backend.claim(entry))
+
+
+class TestMirroredBackend(BackendTests, TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'queue.db')
+        self.backend = MirroredBackend(SQLiteBackend(self.path),
+                                       DjangoBackend())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def other_backend(self):
+        return MirroredBackend(SQLiteBackend(self.path), DjangoBackend())
+
+    def test_writes_are_mirrored(self):
+        self.backend.enqueue('q', ['a', 'b'])
+        entry = next(iter(self.backend.pending('q')))
+        self.backend.claim(entry)
+        self.backend.complete(entry)
+        self.assertEqual(
+            list(models.QueueEntry.objects.values_list('key', 'is_complete')),
+            [('a', True), ('b', False)])
+
+    def test_refused_claims_are_not_mirrored(self):
+        self.backend.enqueue('q', ['a'])
+        entry = next(iter(self.backend.pending('q')))
+        self.backend.claim(entry)
+        with mock.patch.object(self.backend.mirror, 'claim') as claim:
+            self.assertFalse(self.backend.claim(entry))
+        self.assertFalse(claim.called)
+
+    def test_mirror_errors_are_ignored(self):
+        with mock.patch.object(self.backend.mirror, 'enqueue',
+                               side_effect=ValueError('mirror down')):
+            self.assertEqual(self.backend.enqueue('q', ['a']), 1)
+        self.assertEqual(self.pending_keys(), ['a'])
+        self.assertFalse(models.QueueEntry.objects.exists())
+
+    def test_lease_is_primarys(self):
+        self.assertEqual(self.backend.lease, self.backend.primary.lease)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_cleanup
+------------
+
+Tests for `near_queue.cleanup`.
+"""
+
+import errno
+import imaplib
+import socket
+
+from django.test import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from near_queue import cleanup
+from near_queue import retry
+from near_queue import transports
+from near_queue.models import PendingCleanup
+
+
+class Account(object):
+
+    def __init__(self, host):
+        self.host = host
+
+
+class FakeSFTP(object):
+    """
+    An sftp transport, and the connection it opens, over a set of paths.
+    errors maps a path to exceptions to raise, one per remove, first.
+    """
+
+    def __init__(self, paths, errors=None):
+        self.paths = set(paths)
+        self.errors = errors or {}
+        self.calls = []
+        self.connections = 0
+
+    def connect(self, sftp_account):
+        return self
+
+    def open_connection(self):
+        self.connections += 1
+
+    def close_connection(self):
+        pass
+
+    def remove(self, path):
+        self.calls.append(path)
+        if self.errors.get(path):
+            raise self.errors[path].pop(0)
+        if path not in self.paths:
+            raise IOError(errno.ENOENT, 'No such file', path)
+        self.paths.remove(path)
+
+
+class FakeIMAPAccount(Account):
+    """An IMAP account moving UIDs in bulk, failing moves from fail."""
+
+    def __init__(self, host, fail=()):
+        super(FakeIMAPAccount, self).__init__(host)
+        self.fail = fail
+        self.moves = []
+
+    def open_connection(self):
+        pass
+
+    def close_connection(self):
+        pass
+
+    def move_messages(self, mailbox, uids, uid_validity, archive_mbox):
+        if mailbox in self.fail:
+            raise imaplib.IMAP4.error('NO [TRYCREATE] {0}'.format(
+                archive_mbox))
+        self.moves.append((mailbox, uids, uid_validity, archive_mbox))
+
+
+class CleanupTestCase(TestCase):
+
+    def setUp(self):
+        patchers = [
+            mock.patch('near_queue.retry.time.sleep'),
+            mock.patch.dict(retry._breakers, clear=True),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        transports.register('sftp', 'near_queue.transports.sftp')
+
+
+class TestRemoveSFTPFiles(CleanupTestCase):
+
+    paths = ['a', 'b', 'c', 'd', 'e']
+
+    def remove(self, sftp, accounts=(Account('sftp.test'),)):
+        transports.register('sftp', sftp)
+        for path in self.paths:
+            PendingCleanup.record_sftp_remove('sftp://sftp.test', path)
+        cleanup.apply_cleanups(sftp_accounts=accounts, batch_size=2)
+
+    def remaining(self):
+        return list(PendingCleanup.objects.values_list('path', 'attempts'))
+
+    def test_removes_all_over_one_connection(self):
+        sftp = FakeSFTP(self.paths)
+        self.remove(sftp, [Account('sftp.test'), Account('sftp.test')])
+        self.assertEqual(sftp.paths, set())
+        self.assertEqual(sftp.connections, 1)
+        self.assertEqual(self.remaining(), [])
+
+    def test_resumes_from_the_failed_batch(self):
+        sftp = FakeSFTP(self.paths, {'c': [socket.timeout()]})
+        self.remove(sftp)
+        self.assertEqual(sftp.connections, 2)
+        self.assertEqual(sftp.calls, ['a', 'b', 'c', 'c', 'd', 'e'])
+        self.assertEqual(self.remaining(), [])
+
+    def test_already_removed_is_done(self):
+        sftp = FakeSFTP(['a', 'b', 'd'])
+        self.remove(sftp)
+        self.assertEqual(sftp.paths, set())
+        self.assertEqual(self.remaining(), [])
+
+    def test_failures_are_recorded_and_retried(self):
+        denied = IOError(errno.EACCES, 'Permission denied', 'b')
+        sftp = FakeSFTP(self.paths, {'b': [denied]})
+        self.remove(sftp)
+        self.assertEqual(sftp.paths, set(['b']))
+        self.assertEqual(self.remaining(), [('b', 1)])
+        self.assertIn('Permission denied',
+                      PendingCleanup.objects.get().last_error)
+
+        cleanup.apply_cleanups(sftp_accounts=[Account('sftp.test')])
+        self.assertEqual(sftp.paths, set())
+        self.assertEqual(self.remaining(), [])
+
+    def test_connection_failure_leaves_everything_recorded(self):
+        sftp = FakeSFTP(self.paths)
+        sftp.connect = mock.Mock(side_effect=ValueError('bad key'))
+        self.remove(sftp)
+        self.assertEqual(self.remaining(),
+                         [(path, 1) for path in self.paths])
+
+    def test_only_its_endpoint(self):
+        PendingCleanup.record_sftp_remove('sftp://other.test', 'z')
+        sftp = FakeSFTP(self.paths)
+        self.remove(sftp)
+        self.assertEqual(self.remaining(), [('z', 0)])
+
+
+class TestMoveIMAPMessages(CleanupTestCase):
+
+    def move(self, imap):
+        for mailbox, uid in (('INBOX', 1), ('INBOX', 2), ('Other', 3),
+                             ('INBOX', 4)):
+            PendingCleanup.record_imap_move('imap://imap.test', mailbox,
+                                            uid, 7, 'Archive')
+        cleanup.apply_cleanups(imap_accounts=[imap], batch_size=2)
+
+    def test_moves_batches_per_mailbox(self):
+        imap = FakeIMAPAccount('imap.test')
+        self.move(imap)
+        self.assertEqual(imap.moves, [('INBOX', [1, 2], 7, 'Archive'),
+                                      ('INBOX', [4], 7, 'Archive'),
+                                      ('Other', [3], 7, 'Archive')])
+        self.assertFalse(PendingCleanup.objects.exists())
+
+    def test_failed_batch_is_recorded(self):
+        imap = FakeIMAPAccount('imap.test', fail=['Other'])
+        self.move(imap)
+        self.assertEqual(len(imap.moves), 2)
+        failed = PendingCleanup.objects.get()
+        self.assertEqual((failed.mailbox, failed.uid, failed.attempts),
+                         ('Other', 3, 1))
+        self.assertIn('TRYCREATE', failed.last_error)
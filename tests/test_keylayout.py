@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_keylayout
+------------
+
+Tests for `near_queue.keylayout`.
+"""
+
+import datetime
+import unittest
+
+from near_queue import transports
+from near_queue.keylayout import DateLayout
+from near_queue.keylayout import FlatLayout
+from near_queue.keylayout import HashLayout
+from near_queue.keylayout import get_key_layout
+
+
+WHEN = datetime.datetime(2014, 3, 9, 12, 30)
+
+
+class FakeS3(object):
+
+    def __init__(self, prefixes):
+        self.prefixes = prefixes
+
+    def list_prefixes(self, bucket, prefix):
+        return [p for p in self.prefixes
+                if p.startswith(prefix) and p != prefix and
+                '/' not in p[len(prefix):].rstrip('/')]
+
+
+class TestLayouts(unittest.TestCase):
+
+    def test_flat(self):
+        layout = FlatLayout()
+        self.assertEqual(layout.key('data', 'a.csv', WHEN), 'data/a.csv')
+        self.assertEqual(layout.prefixes(None, 'data'), ['data/'])
+        self.assertEqual(layout.prefixes(None, 'data/'), ['data/'])
+        self.assertEqual(layout.sort_key('data/a.csv'), 'data/a.csv')
+
+    def test_date_key(self):
+        self.assertEqual(DateLayout().key('data', 'a.csv', WHEN),
+                         'data/2014/03/09/a.csv')
+
+    def test_date_prefixes_since(self):
+        today = datetime.datetime.utcnow().date()
+        since = today - datetime.timedelta(days=2)
+        prefixes = DateLayout().prefixes(None, 'data', since=since)
+        self.assertEqual(len(prefixes), 3)
+        self.assertEqual(prefixes[0], since.strftime('data/%Y/%m/%d/'))
+        self.assertEqual(prefixes[-1], today.strftime('data/%Y/%m/%d/'))
+
+    def test_date_prefixes_since_future(self):
+        since = datetime.datetime.utcnow().date() + datetime.timedelta(
+            days=1)
+        self.assertEqual(DateLayout().prefixes(None, 'data', since=since),
+                         [])
+
+    def test_date_prefixes_listed(self):
+        transports.register('s3', FakeS3([
+            'data/2014/', 'data/2014/03/', 'data/2014/03/08/',
+            'data/2014/03/09/', 'data/2015/', 'data/2015/01/',
+            'data/2015/01/01/',
+        ]))
+        self.addCleanup(transports.register, 's3', 'near_queue.transports.s3')
+        prefixes = DateLayout().prefixes('bucket', 'data')
+        self.assertEqual(len(prefixes), 24)
+        self.assertEqual(prefixes[:2], ['data/2014/01/', 'data/2014/02/'])
+        self.assertEqual(prefixes[-1], 'data/2015/12/')
+
+    def test_hash(self):
+        layout = HashLayout()
+        key = layout.key('data', 'a.csv', WHEN)
+        shard = key.split('/')[1]
+        self.assertEqual(len(shard), 2)
+        self.assertEqual(key, layout.key('data', 'a.csv'))
+        self.assertEqual(layout.sort_key(key), 'a.csv')
+        prefixes = layout.prefixes(None, 'data')
+        self.assertEqual(len(prefixes), 256)
+        self.assertIn('data/{0}/'.format(shard), prefixes)
+
+    def test_hash_width(self):
+        self.assertEqual(len(HashLayout(width=1).prefixes(None, 'data')), 16)
+
+
+class TestGetKeyLayout(unittest.TestCase):
+
+    def test_names(self):
+        self.assertIsInstance(get_key_layout(None), FlatLayout)
+        self.assertIsInstance(get_key_layout('date'), DateLayout)
+        self.assertIsInstance(get_key_layout(u'hash'), HashLayout)
+
+    def test_objects_passed_through(self):
+        layout = HashLayout(width=1)
+        self.assertIs(get_key_layout(layout), layout)
@@ -2,26 +2,215 @@
 # -*- coding: utf-8 -*-
 
 """
-test_near-queue
+test_models
 ------------
 
-Tests for `near-queue` models module.
+Tests for `near_queue` models, admin and views.
 """
 
-import os
-import shutil
-import unittest
+import datetime
+import json
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.utils.six import StringIO
 
 from near_queue import models
+from near_queue import views
+from near_queue.admin import EstimatedCountQuerySet
+from near_queue.admin import _stats_count
+from near_queue.backends.orm import DjangoBackend
+
+
+class TestQueueStats(TestCase):
+
+    def setUp(self):
+        self.queue = models.Queue.objects.create(name='q')
+
+    def stats(self):
+        return models.QueueStats.objects.get(queue=self.queue)
+
+    def counts(self):
+        stats = self.stats()
+        return stats.pending, stats.in_flight, stats.completed
+
+    def test_save_counts_new_entries(self):
+        models.QueueEntry.objects.create(queue=self.queue, key='a')
+        models.QueueEntry.objects.create(queue=self.queue, key='b',
+                                         is_complete=True)
+        self.assertEqual(self.counts(), (1, 0, 1))
+
+    def test_complete_and_reopen(self):
+        entry = models.QueueEntry.objects.create(queue=self.queue, key='a')
+        entry.mark_as_complete()
+        self.assertEqual(self.counts(), (0, 0, 1))
+        throughput = models.QueueThroughput.objects.get(queue=self.queue)
+        self.assertEqual(throughput.completed, 1)
+        entry.is_complete = False
+        entry.save()
+        self.assertEqual(self.counts(), (1, 0, 0))
 
+    def test_resave_does_not_recount(self):
+        entry = models.QueueEntry.objects.create(queue=self.queue, key='a')
+        entry.save()
+        entry = models.QueueEntry.objects.get(pk=entry.pk)
+        entry.save()
+        self.assertEqual(self.counts(), (1, 0, 0))
 
-class TestNear_queue(unittest.TestCase):
+    def test_delete(self):
+        entry = models.QueueEntry.objects.create(queue=self.queue, key='a')
+        done = models.QueueEntry.objects.create(queue=self.queue, key='b',
+                                                is_complete=True)
+        entry.delete()
+        done.delete()
+        self.assertEqual(self.counts(), (0, 0, 0))
+
+    def test_adjust_is_one_query_once_created(self):
+        models.QueueStats.record_added(self.queue.pk, 1)
+        with self.assertNumQueries(1):
+            models.QueueStats.record_in_flight(self.queue.pk, 1)
+        self.assertEqual(self.counts(), (1, 1, 0))
+
+    def test_backend_bulk_paths(self):
+        backend = DjangoBackend(batch_size=2)
+        backend.enqueue('q', ['a', 'b', 'c'])
+        self.assertEqual(self.counts(), (3, 0, 0))
+        entry = next(iter(backend.pending('q')))
+        backend.claim(entry)
+        self.assertEqual(self.counts(), (3, 1, 0))
+        backend.complete(entry)
+        self.assertEqual(self.counts(), (2, 0, 1))
+        backend.enqueue('q', ['a', 'd'], reopen=True)
+        self.assertEqual(self.counts(), (4, 0, 0))
+
+    def test_expired_claim_is_not_counted_twice(self):
+        backend = DjangoBackend()
+        backend.enqueue('q', ['a'])
+        entry = next(iter(backend.pending('q')))
+        backend.claim(entry)
+        # the worker crashed, and its lease ran out.
+        models.QueueEntry.objects.update(
+            claimed_until=datetime.datetime.utcnow() -
+            datetime.timedelta(seconds=1))
+        self.assertTrue(backend.claim(entry))
+        backend.complete(entry)
+        self.assertEqual(self.counts(), (0, 0, 1))
+
+    def test_summary(self):
+        models.QueueEntry.objects.create(queue=self.queue, key='a')
+        models.QueueEntry.objects.create(queue=self.queue,
+                                         key='b').mark_as_complete()
+        summary = self.stats().summary(hours=2)
+        self.assertEqual((summary['queue'], summary['pending'],
+                          summary['in_flight'], summary['completed']),
+                         ('q', 1, 0, 1))
+        self.assertGreaterEqual(summary['oldest_pending_age'], 0)
+        self.assertEqual([hour['completed']
+                          for hour in summary['completed_per_hour']], [1])
+
+    def test_summary_of_empty_queue(self):
+        models.QueueStats.objects.create(queue=self.queue)
+        summary = self.stats().summary()
+        self.assertIsNone(summary['oldest_pending_age'])
+        self.assertEqual(summary['completed_per_hour'], [])
+
+    def test_rebuild(self):
+        models.QueueEntry.objects.create(queue=self.queue, key='a')
+        models.QueueStats.objects.filter(queue=self.queue).update(
+            pending=10, in_flight=3)
+        models.QueueStats.rebuild(self.queue)
+        self.assertEqual(self.counts(), (1, 0, 0))
+
+
+class TestQueueEntryAdminCounts(TestCase):
 
     def setUp(self):
-        pass
+        self.queue = models.Queue.objects.create(name='q')
+        models.QueueEntry.objects.create(queue=self.queue, key='a')
+        models.QueueEntry.objects.create(queue=self.queue, key='b',
+                                         is_complete=True)
+        self.factory = RequestFactory()
+
+    def count(self, **params):
+        return _stats_count(self.factory.get('/', params))
+
+    def test_queue_filter_counted_from_stats(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.count(queue__id__exact=self.queue.pk), 2)
+        self.assertEqual(self.count(queue__id__exact=self.queue.pk,
+                                    is_complete__exact='0', p='1'), 1)
+        self.assertEqual(self.count(queue__id__exact=self.queue.pk,
+                                    is_complete__exact='1'), 1)
+
+    def test_other_filters_counted_normally(self):
+        self.assertIsNone(self.count())
+        self.assertIsNone(self.count(queue__id__exact=self.queue.pk,
+                                     q='a'))
+        self.assertIsNone(self.count(queue__id__exact='x'))
+
+    def test_small_tables_counted_exactly(self):
+        entries = models.QueueEntry.objects.all()._clone(
+            klass=EstimatedCountQuerySet)
+        self.assertEqual(entries.count(), 2)
+        self.assertEqual(entries.filter(is_complete=True).count(), 1)
+
+
+class TestQueueStatsView(TestCase):
+
+    def setUp(self):
+        for name in ('q', 'other'):
+            queue = models.Queue.objects.create(name=name)
+            models.QueueEntry.objects.create(queue=queue, key='a')
+        self.factory = RequestFactory()
+
+    def get(self, **params):
+        request = self.factory.get('/stats/', params)
+        request.user = User(username='staff', is_staff=True, is_active=True)
+        return views.queue_stats(request)
+
+    def test_every_queue(self):
+        data = json.loads(self.get().content.decode('utf-8'))
+        self.assertEqual(sorted((s['queue'], s['pending']) for s in data),
+                         [('other', 1), ('q', 1)])
+
+    def test_one_queue(self):
+        data = json.loads(self.get(queue='q', hours='x').content.decode(
+            'utf-8'))
+        self.assertEqual([s['queue'] for s in data], ['q'])
+
+
+class TestProfileReport(TestCase):
+
+    def setUp(self):
+        now = datetime.datetime.utcnow()
+        for name, key, duration, failed in (('q', 'a', 1.0, False),
+                                            ('q', 'b', 3.0, True),
+                                            ('other', 'c', 2.5, False)):
+            queue, _ = models.Queue.objects.get_or_create(name=name)
+            models.EntryProfile.objects.create(
+                queue=queue, key=key, processor='test.processor',
+                time_started=now, duration=duration, failed=failed)
+
+    def report(self, **options):
+        out = StringIO()
+        call_command('profile_report', stdout=out, **options)
+        return [line.split() for line in out.getvalue().splitlines()[1:]]
+
+    def test_by_queue(self):
+        self.assertEqual([(row[0], row[-1]) for row in self.report()],
+                         [('2', 'q'), ('1', 'other')])
+
+    def test_by_key_and_max(self):
+        rows = self.report(by='key', order='max')
+        self.assertEqual([row[-1] for row in rows], ['b', 'c', 'a'])
 
-    def test_something(self):
-        pass
+    def test_failed(self):
+        rows = self.report(by='key', failed=True)
+        self.assertEqual([row[-1] for row in rows], ['b'])
 
-    def tearDown(self):
-        pass
\ No newline at end of file
+    def test_bad_grouping(self):
+        with self.assertRaises(CommandError):
+            self.report(by='host')
@@ -0,0 +1,446 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_processors
+------------
+
+Tests for `near_queue.processors`.
+"""
+
+import collections
+import datetime
+import os
+import posixpath
+import shutil
+import stat
+import tempfile
+import threading
+import unittest
+
+from django.test import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from near_queue import processors
+from near_queue import transports
+from near_queue.backends import Entry
+from near_queue.backends.sqlite import SQLiteBackend
+from near_queue.models import EntryProfile
+from near_queue.models import PendingCleanup
+from near_queue.processors import SFTPSource
+from near_queue.processors import _profiled
+from near_queue.processors import _renewing_claim
+from near_queue.scratch import ScratchSpace
+
+
+Attr = collections.namedtuple('Attr', 'filename st_mode')
+
+
+class FakeSFTP(object):
+    """A remote tree, as {folder: {name: None (file) or {...}}}."""
+
+    def __init__(self, tree):
+        self.tree = tree
+
+    def _find(self, path):
+        node = self.tree
+        for part in path.strip('/').split('/'):
+            if not isinstance(node, dict) or part not in node:
+                raise IOError(2, 'No such file', path)
+            node = node[part]
+        return node
+
+    def listdir(self, folder):
+        node = self._find(folder)
+        if not isinstance(node, dict):
+            raise IOError(20, 'Not a directory', folder)
+        return sorted(node)
+
+
+class FakeSFTPWithAttrs(FakeSFTP):
+
+    def listdir_attr(self, folder):
+        return [Attr(name, stat.S_IFDIR if isinstance(
+            self._find(posixpath.join(folder, name)), dict) else stat.S_IFREG)
+            for name in self.listdir(folder)]
+
+
+TREE = {
+    'incoming': {
+        'a.csv': None,
+        'archive': {
+            'old.csv': None,
+            'deeper': {'older.csv': None},
+        },
+        'notes.txt': None,
+    },
+}
+
+
+class TestSFTPSource(unittest.TestCase):
+
+    def list_files(self, source, sftp_class=FakeSFTPWithAttrs):
+        return sorted(source.list_files(sftp_class(TREE)))
+
+    def test_flat(self):
+        source = SFTPSource('incoming', file_regex=r'incoming/.*')
+        self.assertEqual(self.list_files(source),
+                         ['incoming/a.csv', 'incoming/notes.txt'])
+
+    def test_flat_never_matches_folders(self):
+        source = SFTPSource('incoming', file_regex=r'incoming/.*')
+        self.assertEqual(self.list_files(source, FakeSFTP),
+                         ['incoming/a.csv', 'incoming/notes.txt'])
+
+    def test_recursive_never_matches_folders(self):
+        source = SFTPSource('incoming', file_regex=r'incoming/.*',
+                            recursive=True)
+        expected = ['incoming/a.csv', 'incoming/archive/deeper/older.csv',
+                    'incoming/archive/old.csv', 'incoming/notes.txt']
+        self.assertEqual(self.list_files(source), expected)
+        self.assertEqual(self.list_files(source, FakeSFTP), expected)
+
+    def test_recursive_pattern(self):
+        source = SFTPSource('incoming', pattern='*.csv', recursive=True)
+        self.assertEqual(self.list_files(source, FakeSFTP),
+                         ['incoming/a.csv',
+                          'incoming/archive/deeper/older.csv',
+                          'incoming/archive/old.csv'])
+
+
+class TestProfiled(TestCase):
+
+    def run_profiled(self, processor_fn, mode='timing'):
+        profiled = _profiled(processor_fn, mode, False, 'test.processor')
+        return profiled('/tmp/a.csv', Entry('q', 'data/a.csv'), 123)
+
+    def test_records_rows(self):
+        self.assertEqual(self.run_profiled(lambda fname: 42), 42)
+        profile = EntryProfile.objects.get()
+        self.assertEqual((profile.queue.name, profile.key, profile.processor,
+                          profile.input_bytes, profile.rows, profile.failed),
+                         ('q', 'data/a.csv', 'test.processor', 123, 42,
+                          False))
+
+    def test_rows_only_from_ints(self):
+        self.run_profiled(lambda fname: True)
+        self.run_profiled(lambda fname: None)
+        self.assertEqual(list(EntryProfile.objects.values_list('rows',
+                                                               flat=True)),
+                         [None, None])
+
+    def test_records_failures(self):
+        def processor(fname):
+            raise ValueError('bad file')
+        with self.assertRaises(ValueError):
+            self.run_profiled(processor, mode='cprofile')
+        profile = EntryProfile.objects.get()
+        self.assertTrue(profile.failed)
+        self.assertIsNone(profile.rows)
+        self.assertIn('processor', profile.profile)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            _profiled(lambda fname: None, 'trace', False, None)
+
+
+class RenewingBackend(object):
+
+    lease = 0.04
+
+    def __init__(self, renewals):
+        self.renewed = threading.Event()
+        self.renewals = renewals
+
+    def renew(self, entry):
+        self.renewals.append(entry)
+        self.renewed.set()
+        return True
+
+
+class TestRenewingClaim(unittest.TestCase):
+
+    def test_renews_until_done(self):
+        renewals = []
+        backend = RenewingBackend(renewals)
+        entry = Entry('q', 'data/a.csv')
+        with _renewing_claim(backend, entry):
+            self.assertTrue(backend.renewed.wait(5))
+        done = len(renewals)
+        backend.renewed.clear()
+        self.assertFalse(backend.renewed.wait(0.1))
+        self.assertEqual(renewals, [entry] * done)
+
+    def test_stops_once_lost(self):
+        renewals = []
+        backend = RenewingBackend(renewals)
+        backend.renew = lambda entry: renewals.append(entry)
+        with _renewing_claim(backend, Entry('q', 'data/a.csv')):
+            threading.Event().wait(0.2)
+        self.assertEqual(len(renewals), 1)
+
+
+S3Account = collections.namedtuple('S3Account', 'host bucket')
+
+
+class FakeS3(object):
+    """An s3 transport over {key: contents}, failing downloads of fail."""
+
+    def __init__(self, objects, fail=()):
+        self.objects = objects
+        self.fail = fail
+
+    def get_bucket(self, s3_account):
+        return self
+
+    def key_size(self, bucket, key):
+        return len(self.objects[key])
+
+    def download(self, bucket, key, fname):
+        if key in self.fail:
+            raise ValueError('cannot download {0}'.format(key))
+        with open(fname, 'wb') as f:
+            f.write(self.objects[key])
+
+    def upload(self, bucket, key, fname):
+        if key in self.fail:
+            raise ValueError('cannot upload {0}'.format(key))
+        with open(fname, 'rb') as f:
+            self.objects[key] = f.read()
+
+
+class TestProcessS3Files(unittest.TestCase):
+
+    keys = ['a/1', 'a/2', 'b/1', 'b/2']
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.backend = SQLiteBackend(os.path.join(self.tmpdir, 'queue.db'))
+        self.backend.enqueue('q', self.keys, sort_key_fn=lambda key: key,
+                             partition_fn=lambda key: key.split('/')[0])
+        scratch = ScratchSpace(root=os.path.join(self.tmpdir, 'scratch'))
+        for target, value in (('get_backend', lambda: self.backend),
+                              ('get_scratch_space', lambda: scratch)):
+            patcher = mock.patch.object(processors, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.processed = []
+
+    def tearDown(self):
+        transports.register('s3', 'near_queue.transports.s3')
+        shutil.rmtree(self.tmpdir)
+
+    def process(self, fail=(), processor_fn=None, **kwargs):
+        transports.register('s3', FakeS3(
+            dict((key, key.encode('ascii')) for key in self.keys), fail))
+
+        def processor(fname):
+            with open(fname, 'rb') as f:
+                self.processed.append(f.read().decode('ascii'))
+        processors.process_s3_files('q', S3Account('s3.test', 'bucket'),
+                                    processor_fn or processor, False,
+                                    workers=2, **kwargs)
+
+    def pending(self):
+        return [e.key for e in self.backend.pending('q')]
+
+    def test_all_partitions(self):
+        self.process()
+        self.assertEqual(sorted(self.processed), self.keys)
+        self.assertEqual(self.pending(), [])
+
+    def test_download_failure_stops_only_its_partition(self):
+        self.process(fail=['a/1'])
+        self.assertEqual(self.processed, ['b/1', 'b/2'])
+        self.assertEqual(self.pending(), ['a/1', 'a/2'])
+
+    def test_processor_error_raised_after_other_partitions(self):
+        def processor(fname):
+            with open(fname, 'rb') as f:
+                key = f.read().decode('ascii')
+            if key == 'a/1':
+                raise ValueError('bad file')
+            self.processed.append(key)
+        with self.assertRaises(ValueError):
+            self.process(processor_fn=processor)
+        self.assertEqual(self.processed, ['b/1', 'b/2'])
+        self.assertEqual(self.pending(), ['a/1', 'a/2'])
+        # released, for the next run.
+        self.assertTrue(self.backend.claim(next(iter(
+            self.backend.pending('q')))))
+
+    def test_no_memory_profiling_with_workers(self):
+        with self.assertRaises(ValueError):
+            self.process(profile='timing', profile_memory=True)
+        self.assertEqual(self.processed, [])
+
+
+class FakeIMAPAccount(object):
+    """Downloads one attachment per message into folder."""
+
+    host = 'imap.test'
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.downloads = 0
+        self.moves = []
+
+    def open_connection(self):
+        pass
+
+    def close_connection(self):
+        pass
+
+    def download_attachments(self, mailbox, uid, uid_validity,
+                             filename_regex=None):
+        self.downloads += 1
+        local_fname = os.path.join(self.folder, '{0}.csv'.format(uid))
+        with open(local_fname, 'w') as f:
+            f.write('a,b\n')
+        return [{'utc_date': datetime.datetime(2014, 1, 2),
+                 'remote_fname': 'report.csv',
+                 'local_fname': local_fname}]
+
+    def move_messages(self, mailbox, uids, uid_validity, archive_mbox):
+        self.moves.append((mailbox, uids, uid_validity, archive_mbox))
+
+
+class TestIMAPAttachments(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.downloads = os.path.join(self.tmpdir, 'downloads')
+        os.mkdir(self.downloads)
+        self.scratch = os.path.join(self.tmpdir, 'scratch')
+        self.backend = SQLiteBackend(os.path.join(self.tmpdir, 'queue.db'))
+        self.backend.enqueue('imap', ['INBOX;UID=1/;UIDVALIDITY=7'])
+        scratch = ScratchSpace(root=self.scratch)
+        for target, value in (('get_backend', lambda: self.backend),
+                              ('get_scratch_space', lambda: scratch)):
+            patcher = mock.patch.object(processors, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        transports.register('s3', 'near_queue.transports.s3')
+        shutil.rmtree(self.tmpdir)
+
+    def send(self, s3, account=None, archive_mbox=None):
+        transports.register('s3', s3)
+        if account is None:
+            account = FakeIMAPAccount(self.downloads)
+        processors.send_imap_attachments_into_s3(
+            'imap', 'process', account, None,
+            S3Account('s3.test', 'bucket'), 'data',
+            imap_archive_mbox=archive_mbox)
+        return account
+
+    def leftovers(self):
+        return [os.path.join(root, name)
+                for root, _, names in os.walk(self.tmpdir)
+                for name in names
+                if not name.startswith(('queue.db', '.lock'))]
+
+    def test_uploaded(self):
+        s3 = FakeS3({})
+        account = self.send(s3)
+        self.assertEqual(list(s3.objects),
+                         ['data/2014-01-02T00:00:00_report.csv.gz'])
+        self.assertEqual(self.leftovers(), [])
+        self.assertEqual([e.key for e in self.backend.pending('imap')], [])
+        self.assertEqual(account.moves, [])
+        self.assertFalse(PendingCleanup.objects.exists())
+
+    def test_archived_once_uploaded(self):
+        PendingCleanup.record_imap_move('imap://imap.test', 'INBOX', 4, 6,
+                                        'Archive')
+        account = self.send(FakeS3({}), archive_mbox='Archive')
+        self.assertEqual(account.moves, [('INBOX', [4], 6, 'Archive'),
+                                         ('INBOX', [1], 7, 'Archive')])
+        self.assertFalse(PendingCleanup.objects.exists())
+
+    def test_unnamed_account_fails_before_upload(self):
+        s3 = FakeS3({})
+        account = FakeIMAPAccount(self.downloads)
+        account.host = None
+        with self.assertRaises(ValueError):
+            self.send(s3, account, archive_mbox='Archive')
+        self.assertEqual((account.downloads, s3.objects), (0, {}))
+        self.assertEqual([e.key for e in self.backend.pending('imap')],
+                         ['INBOX;UID=1/;UIDVALIDITY=7'])
+
+    def test_failed_upload_leaves_no_files(self):
+        self.send(FakeS3({}, fail=['data/2014-01-02T00:00:00_report.csv.gz']))
+        self.assertEqual(self.leftovers(), [])
+        self.assertEqual([e.key for e in self.backend.pending('imap')],
+                         ['INBOX;UID=1/;UIDVALIDITY=7'])
+
+
+SFTPAccount = collections.namedtuple('SFTPAccount', 'username hostname')
+
+
+class TestSFTPS3Name(unittest.TestCase):
+
+    default = SFTPAccount('u', 'sftp.test')
+    other = SFTPAccount('u', 'other.test')
+    sources = [SFTPSource('in', recursive=True, account=default),
+               SFTPSource('in/2014', account=default),
+               SFTPSource('in', account=other)]
+
+    def name(self, path, account=default):
+        return processors._sftp_s3_name(account, path, self.default,
+                                        self.sources)
+
+    def test_relative_to_source_folder(self):
+        self.assertEqual(self.name('in/report.csv'), 'report.csv')
+        self.assertEqual(self.name('in/2014/01/report.csv'),
+                         '01/report.csv')
+        self.assertEqual(self.name('in/2014/report.csv'), 'report.csv')
+
+    def test_other_accounts_below_their_endpoint(self):
+        self.assertEqual(self.name('in/report.csv', self.other),
+                         'u@other.test/report.csv')
+
+    def test_without_sources(self):
+        self.assertEqual(processors._sftp_s3_name(
+            self.default, 'in/01/report.csv', self.default),
+            'report.csv')
+
+
+class TestHandleEntries(unittest.TestCase):
+
+    keys = ['down/1', 'up/1', 'down/2', 'up/2']
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.backend = SQLiteBackend(os.path.join(self.tmpdir, 'queue.db'))
+        self.backend.enqueue('q', self.keys, sort_key_fn=lambda key: key[-1])
+        patcher = mock.patch.object(processors, 'get_backend',
+                                    lambda: self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.handled = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def handle(self, down):
+        def handle(entry):
+            self.handled.append(entry.key)
+            if entry.key.startswith(down):
+                raise processors.CircuitOpen(down)
+        processors._handle_entries('q', handle,
+                                   lambda entry: entry.key.split('/')[0])
+        return [e.key for e in self.backend.pending('q')]
+
+    def test_open_source_endpoint_skips_its_entries(self):
+        self.assertEqual(self.handle('down'), ['down/1', 'down/2'])
+        self.assertEqual(self.handled, ['down/1', 'up/1', 'up/2'])
+
+    def test_open_shared_endpoint_stops(self):
+        self.assertEqual(self.handle(''), self.keys)
+        self.assertEqual(self.handled, ['down/1'])
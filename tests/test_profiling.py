@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_profiling
+------------
+
+Tests for `near_queue.profiling`.
+"""
+
+import time
+import unittest
+
+from near_queue.profiling import profiling
+
+
+def busy_loop(seconds):
+    end = time.time() + seconds
+    n = 0
+    while time.time() < end:
+        n += 1
+    return n
+
+
+def profiled_call(fn, arg, mode='timing', memory=False):
+    with profiling(mode, memory) as stats:
+        result = fn(arg)
+    return result, stats
+
+
+class TestProfiling(unittest.TestCase):
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            profiled_call(busy_loop, 0, mode='trace')
+
+    def test_timing(self):
+        result, stats = profiled_call(busy_loop, 0.02)
+        self.assertGreater(result, 0)
+        self.assertGreaterEqual(stats['duration'], 0.02)
+        self.assertIsNone(stats['peak_memory'])
+        self.assertEqual(stats['profile'], '')
+
+    def test_cprofile_report(self):
+        _, stats = profiled_call(busy_loop, 0.01, mode='cprofile')
+        self.assertIn('busy_loop', stats['profile'])
+
+    def test_sample_report(self):
+        _, stats = profiled_call(busy_loop, 0.1, mode='sample')
+        self.assertIn('samples every', stats['profile'])
+        self.assertIn('busy_loop', stats['profile'])
+
+    def test_memory(self):
+        try:
+            import tracemalloc  # noqa
+        except ImportError:
+            raise unittest.SkipTest('tracemalloc needs python 3.4+')
+        _, stats = profiled_call(lambda n: [0] * n, 100000, memory=True)
+        self.assertGreater(stats['peak_memory'], 100000)
+
+    def test_stats_filled_in_when_raising(self):
+        with self.assertRaises(KeyError):
+            with profiling('cprofile') as stats:
+                busy_loop(0.01)
+                raise KeyError
+        self.assertGreaterEqual(stats['duration'], 0.01)
+        self.assertIn('busy_loop', stats['profile'])
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_reconcile
+------------
+
+Tests for `near_queue.reconcile` and the rebuild_process_queue command.
+"""
+
+import collections
+import datetime
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils.six import StringIO
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from near_queue import reconcile
+from near_queue import retry
+from near_queue import transports
+from near_queue.backends.orm import DjangoBackend
+from near_queue.processors import Processor
+
+
+S3Account = collections.namedtuple('S3Account', 'host bucket')
+
+ACCOUNT = S3Account('s3.test', 'bucket')
+
+KEYS = [
+    'data/2014/03/08/a.csv',
+    'data/2014/03/09/b.csv',
+    'data/2014/03/09/c.csv',
+    'data/2015/01/01/d.csv',
+]
+
+
+class FakeS3(object):
+    """An s3 transport listing a set of keys."""
+
+    def __init__(self, keys):
+        self.keys = keys
+
+    def get_bucket(self, s3_account):
+        return self
+
+    def list_keys(self, bucket, prefix):
+        return [key for key in self.keys if key.startswith(prefix)]
+
+    def list_prefixes(self, bucket, prefix):
+        return sorted(set(
+            prefix + key[len(prefix):].split('/')[0] + '/'
+            for key in self.keys
+            if key.startswith(prefix) and '/' in key[len(prefix):]))
+
+
+class DateProcessor(Processor):
+    S3_PROCESS_QUEUE = 'process'
+    S3_ACCOUNT = ACCOUNT
+    S3_DIRECTORY = 'data'
+    S3_KEY_LAYOUT = 'date'
+
+
+class ReconcileTestCase(TestCase):
+
+    def setUp(self):
+        transports.register('s3', FakeS3(KEYS))
+        patcher = mock.patch.dict(retry._breakers, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.backend = DjangoBackend()
+        patcher = mock.patch.object(reconcile, 'get_backend',
+                                    lambda: self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.backend.enqueue('process', [KEYS[0], 'data/2014/01/01/gone.csv'])
+
+    def tearDown(self):
+        transports.register('s3', 'near_queue.transports.s3')
+
+    def pending(self):
+        return sorted(e.key for e in self.backend.pending('process'))
+
+
+class TestReconcile(ReconcileTestCase):
+
+    def test_listed_through_each_layout(self):
+        for layout in ('date', None):
+            self.assertEqual(
+                reconcile.list_s3_keys(ACCOUNT, 'data', layout, workers=2),
+                set(KEYS))
+
+    def test_missing_and_extra(self):
+        missing, extra = reconcile.reconcile('process', ACCOUNT, 'data',
+                                             'date')
+        self.assertEqual(missing, set(KEYS[1:]))
+        self.assertEqual(extra, set(['data/2014/01/01/gone.csv']))
+
+    def test_since(self):
+        with mock.patch('near_queue.keylayout.datetime') as dt:
+            dt.datetime.utcnow.return_value = datetime.datetime(2014, 3, 10)
+            dt.timedelta = datetime.timedelta
+            missing, extra = reconcile.reconcile(
+                'process', ACCOUNT, 'data', 'date',
+                since=datetime.date(2014, 3, 9))
+        self.assertEqual(missing, set(KEYS[1:3]))
+        self.assertEqual(extra, set([KEYS[0], 'data/2014/01/01/gone.csv']))
+
+    def test_rebuild(self):
+        missing = reconcile.rebuild_process_queue('process', ACCOUNT, 'data',
+                                                  'date')
+        self.assertEqual(missing, KEYS[1:])
+        self.assertEqual(self.pending(),
+                         ['data/2014/01/01/gone.csv'] + KEYS)
+
+    def test_rebuild_dry_run(self):
+        missing = reconcile.rebuild_process_queue('process', ACCOUNT, 'data',
+                                                  'date', dry_run=True)
+        self.assertEqual(missing, KEYS[1:])
+        self.assertEqual(self.pending(),
+                         ['data/2014/01/01/gone.csv', KEYS[0]])
+
+
+class TestRebuildCommand(ReconcileTestCase):
+
+    def rebuild(self, *args, **options):
+        out = StringIO()
+        call_command('rebuild_process_queue', *args, stdout=out, **options)
+        return out.getvalue().splitlines()
+
+    def test_rebuild(self):
+        lines = self.rebuild('tests.test_reconcile.DateProcessor',
+                             dry_run=True)
+        self.assertEqual(lines, KEYS[1:] + ['3 missing from process'])
+        self.assertEqual(len(self.pending()), 2)
+        self.rebuild('tests.test_reconcile.DateProcessor')
+        self.assertEqual(len(self.pending()), 5)
+
+    def test_bad_processor(self):
+        with self.assertRaises(CommandError):
+            self.rebuild('tests.test_reconcile.Missing')
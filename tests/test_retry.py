@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_retry
+------------
+
+Tests for `near_queue.retry`.
+"""
+
+import errno
+import socket
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from near_queue import retry
+from near_queue.retry import CircuitBreaker
+from near_queue.retry import CircuitOpen
+from near_queue.retry import breaker_name
+from near_queue.retry import call_with_retry
+from near_queue.retry import endpoint_name
+from near_queue.retry import is_transient
+
+
+class S3ResponseError(Exception):
+
+    def __init__(self, status):
+        self.status = status
+
+
+class SSHException(Exception):
+    pass
+
+
+class TestIsTransient(unittest.TestCase):
+
+    def test_timeouts_and_dropped_connections(self):
+        self.assertTrue(is_transient(socket.timeout()))
+        self.assertTrue(is_transient(EOFError()))
+        self.assertTrue(is_transient(IOError(errno.ECONNRESET, 'reset')))
+        self.assertTrue(is_transient(SSHException()))
+
+    def test_http_status(self):
+        self.assertTrue(is_transient(S3ResponseError(503)))
+        self.assertTrue(is_transient(S3ResponseError(429)))
+        self.assertTrue(is_transient(S3ResponseError(408)))
+        self.assertFalse(is_transient(S3ResponseError(404)))
+        self.assertFalse(is_transient(S3ResponseError(403)))
+
+    def test_permanent(self):
+        self.assertFalse(is_transient(IOError(errno.ENOENT, 'missing')))
+        self.assertFalse(is_transient(ValueError()))
+        self.assertFalse(is_transient(KeyError()))
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('near_queue.retry.time.time')
+        self.time = patcher.start()
+        self.time.return_value = 1000.0
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker('test', failure_threshold=2,
+                                      reset_timeout=10.0)
+
+    def test_opens_after_threshold(self):
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.is_open)
+        self.assertFalse(self.breaker.allow())
+
+    def test_success_resets_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.is_open)
+
+    def test_half_open_lets_one_trial_through(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.time.return_value += 10.0
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+
+    def test_trial_success_closes(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.time.return_value += 10.0
+        self.breaker.allow()
+        self.breaker.record_success()
+        self.assertFalse(self.breaker.is_open)
+        self.assertTrue(self.breaker.allow())
+
+    def test_trial_failure_reopens(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.time.return_value += 10.0
+        self.breaker.allow()
+        self.breaker.record_failure()
+        self.time.return_value += 5.0
+        self.assertFalse(self.breaker.allow())
+
+
+SETTINGS = {
+    'NEAR_QUEUE_RETRY_ATTEMPTS': 4,
+    'NEAR_QUEUE_RETRY_BASE_DELAY': 1.0,
+    'NEAR_QUEUE_RETRY_MAX_DELAY': 3.0,
+    'NEAR_QUEUE_BREAKER_THRESHOLD': 10,
+    'NEAR_QUEUE_BREAKER_RESET_TIMEOUT': 60.0,
+}
+
+
+class TestCallWithRetry(unittest.TestCase):
+
+    def setUp(self):
+        patchers = [
+            mock.patch('near_queue.retry._setting',
+                       lambda name, default: SETTINGS.get(name, default)),
+            mock.patch('near_queue.retry.time.sleep'),
+            # always the longest delay allowed, the cap.
+            mock.patch('near_queue.retry.random.uniform',
+                       lambda low, high: high),
+            mock.patch.dict(retry._breakers, clear=True),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.sleep = retry.time.sleep
+
+    def failing(self, *errors):
+        calls = []
+        errors = list(errors)
+
+        def fn():
+            calls.append(1)
+            if errors:
+                raise errors.pop(0)
+            return 'ok'
+        return fn, calls
+
+    def test_retries_transient_until_success(self):
+        fn, calls = self.failing(socket.timeout(), socket.timeout())
+        self.assertEqual(call_with_retry(fn, 'sftp://host'), 'ok')
+        self.assertEqual(len(calls), 3)
+
+    def test_gives_up_after_attempts(self):
+        fn, calls = self.failing(*[socket.timeout()] * 5)
+        with self.assertRaises(socket.timeout):
+            call_with_retry(fn, 'sftp://host')
+        self.assertEqual(len(calls), 4)
+
+    def test_explicit_attempts(self):
+        fn, calls = self.failing(*[socket.timeout()] * 5)
+        with self.assertRaises(socket.timeout):
+            call_with_retry(fn, 'sftp://host', attempts=2)
+        self.assertEqual(len(calls), 2)
+
+    def test_backoff_doubles_up_to_cap(self):
+        fn, calls = self.failing(*[socket.timeout()] * 5)
+        with self.assertRaises(socket.timeout):
+            call_with_retry(fn, 'sftp://host')
+        self.assertEqual([c[0][0] for c in self.sleep.call_args_list],
+                         [1.0, 2.0, 3.0])
+
+    def test_permanent_error_not_retried(self):
+        fn, calls = self.failing(ValueError())
+        with self.assertRaises(ValueError):
+            call_with_retry(fn, 'sftp://host')
+        self.assertEqual(len(calls), 1)
+        self.assertFalse(retry.get_breaker('sftp://host').failures)
+
+    def test_open_circuit_does_not_call(self):
+        breaker = retry.get_breaker('sftp://host')
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        fn, calls = self.failing()
+        with self.assertRaises(CircuitOpen):
+            call_with_retry(fn, 'sftp://host')
+        self.assertEqual(calls, [])
+
+
+class Account(object):
+
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+class TestEndpointName(unittest.TestCase):
+
+    def test_names(self):
+        self.assertEqual(endpoint_name('s3', Account(host='s3.test',
+                                                     bucket='data')),
+                         's3://s3.test/data')
+        self.assertEqual(endpoint_name('sftp', Account(hostname='h',
+                                                       username='u')),
+                         'sftp://u@h')
+        self.assertEqual(endpoint_name('imap', Account(host='h')),
+                         'imap://h')
+        self.assertEqual(endpoint_name('imap', Account(endpoint='imap://x')),
+                         'imap://x')
+
+    def test_same_for_another_account_object(self):
+        self.assertEqual(endpoint_name('sftp', Account(hostname='h')),
+                         endpoint_name('sftp', Account(hostname='h')))
+
+    def test_no_host(self):
+        with self.assertRaises(ValueError):
+            endpoint_name('imap', Account(username='u'))
+
+    def test_breaker_name_falls_back_to_the_object(self):
+        account = Account(username='u')
+        self.assertEqual(breaker_name('imap', account),
+                         breaker_name('imap', account))
+        self.assertNotEqual(breaker_name('imap', account),
+                            breaker_name('imap', Account(username='u')))
+        self.assertEqual(breaker_name('imap', Account(host='h')), 'imap://h')
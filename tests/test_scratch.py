@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_scratch
+------------
+
+Tests for `near_queue.scratch`.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from near_queue.scratch import ScratchSpace
+from near_queue.scratch import ScratchSpaceExhausted
+
+
+class TestScratchSpace(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def space(self, **kwargs):
+        kwargs.setdefault('budget', 100)
+        kwargs.setdefault('poll_interval', 0.01)
+        return ScratchSpace(self.root, **kwargs)
+
+    def entries(self):
+        return [name for name in os.listdir(self.root)
+                if name.startswith('nq-')]
+
+    def test_file_removed_with_siblings(self):
+        with self.space().tempfile(size=10) as fname:
+            with open(fname + '.gz', 'w') as f:
+                f.write('x')
+        self.assertEqual(self.entries(), [])
+
+    def test_removed_on_exception(self):
+        with self.assertRaises(KeyError):
+            with self.space().tempfile(size=10) as fname:
+                raise KeyError
+        self.assertFalse(os.path.exists(fname))
+        self.assertEqual(self.entries(), [])
+
+    def test_usage_counts_reservation_until_written(self):
+        space = self.space()
+        with space.tempfile(size=40) as fname:
+            self.assertEqual(space.usage(), 40)
+            with open(fname, 'w') as f:
+                f.write('x' * 60)
+            self.assertEqual(space.usage(), 60)
+        self.assertEqual(space.usage(), 0)
+
+    def test_budget_shared_between_instances(self):
+        # each instance stands in for a separate process on the same root.
+        first, second = self.space(), self.space(timeout=0.05)
+        with first.tempfile(size=80):
+            self.assertEqual(second.usage(), 80)
+            with self.assertRaises(ScratchSpaceExhausted):
+                with second.tempfile(size=80):
+                    pass
+
+    def test_blocks_until_room(self):
+        first, second = self.space(), self.space(timeout=5)
+        held = first.tempfile(size=80)
+        held.__enter__()
+        timer = threading.Timer(0.1, held.__exit__, (None, None, None))
+        timer.start()
+        start = time.time()
+        try:
+            with second.tempfile(size=80):
+                self.assertGreaterEqual(time.time() - start, 0.05)
+        finally:
+            timer.join()
+
+    def test_oversized_admitted_when_idle(self):
+        with self.space().tempfile(size=1000) as fname:
+            self.assertTrue(os.path.exists(fname))
+
+    def test_sweep_removes_dead_processes_dirs(self):
+        child = subprocess.Popen([sys.executable, '-c', 'pass'])
+        child.wait()
+        orphan = os.path.join(self.root, 'nq-{0}-orphan'.format(child.pid))
+        os.mkdir(orphan)
+        space = self.space()
+        with space.tempfile(size=10) as fname:
+            self.assertEqual(space.sweep(), 1)
+            self.assertFalse(os.path.exists(orphan))
+            self.assertTrue(os.path.exists(fname))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_transports
+------------
+
+Tests for `near_queue.transports`.
+"""
+
+import imaplib
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from near_queue import transports
+from near_queue.transports import gpg
+from near_queue.transports import imap
+
+
+class TestRegister(unittest.TestCase):
+
+    def tearDown(self):
+        transports.register('gpg', 'near_queue.transports.gpg')
+
+    def test_unicode_module_path(self):
+        transports.register('gpg', u'near_queue.transports.gpg')
+        self.assertIs(transports.get_transport('gpg'), gpg)
+
+    def test_object(self):
+        backend = object()
+        transports.register('gpg', backend)
+        self.assertIs(transports.get_transport('gpg'), backend)
+
+
+class FakeIMAP4(imaplib.IMAP4):
+    """An imaplib client recording the commands sent, never connected."""
+
+    def __init__(self, capabilities, uid_validity=7):
+        self.capabilities = capabilities
+        self.uid_validity = uid_validity
+        self.commands = []
+
+    def select(self, mailbox='INBOX', readonly=False):
+        self.commands.append(('SELECT', mailbox))
+        return 'OK', [b'3']
+
+    def response(self, code):
+        return code, [str(self.uid_validity).encode('ascii')]
+
+    def uid(self, command, *args):
+        self.commands.append((command,) + args)
+        return 'OK', [None]
+
+    def expunge(self):
+        self.commands.append(('EXPUNGE',))
+        return 'OK', [None]
+
+
+class Account(object):
+
+    def __init__(self, client):
+        self.client = client
+
+
+class TestMoveMessages(unittest.TestCase):
+
+    def move(self, capabilities, uid_validity=7):
+        client = FakeIMAP4(capabilities)
+        imap.move_messages(Account(client), 'INBOX', [3, 1], uid_validity,
+                           'Archive "old"')
+        return client.commands
+
+    def test_uid_move(self):
+        with mock.patch.dict(imaplib.Commands, {'MOVE': ('SELECTED',)}):
+            commands = self.move(('IMAP4REV1', 'MOVE'))
+        self.assertEqual(commands, [('SELECT', '"INBOX"'),
+                                    ('MOVE', '1,3', '"Archive \\"old\\""')])
+
+    def test_uidplus(self):
+        commands = self.move(('IMAP4REV1', 'UIDPLUS'))
+        self.assertEqual(commands[1:], [
+            ('COPY', '1,3', '"Archive \\"old\\""'),
+            ('STORE', '1,3', '+FLAGS.SILENT', '(\\Deleted)'),
+            ('EXPUNGE', '1,3')])
+
+    def test_refused_without_move_or_uidplus(self):
+        client = FakeIMAP4(('IMAP4REV1',))
+        with self.assertRaises(imaplib.IMAP4.error):
+            imap.move_messages(Account(client), 'INBOX', [1], 7, 'Archive')
+        self.assertEqual(client.commands, [])
+
+    def test_account_move_without_move_or_uidplus(self):
+        account = mock.Mock(spec=['move', 'client'])
+        account.client = FakeIMAP4(('IMAP4REV1',))
+        imap.move_messages(account, 'INBOX', [1], 7, 'Archive')
+        self.assertEqual(account.move.call_args_list,
+                         [mock.call('INBOX', 1, 7, 'Archive')])
+        self.assertEqual(account.client.commands, [])
+
+    def test_uid_validity_changed(self):
+        with self.assertRaises(imaplib.IMAP4.error):
+            self.move(('IMAP4REV1', 'UIDPLUS'), uid_validity=8)
+
+    def test_account_move(self):
+        account = mock.Mock(spec=['move'])
+        imap.move_messages(account, 'INBOX', [1, 2], 7, 'Archive')
+        self.assertEqual(account.move.call_args_list,
+                         [mock.call('INBOX', 1, 7, 'Archive'),
+                          mock.call('INBOX', 2, 7, 'Archive')])
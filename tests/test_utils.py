@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_utils
+------------
+
+Tests for `near_queue.utils`.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from near_queue.utils import iter_csv_lines
+from near_queue.utils import mapped_file
+
+
+class TestMappedFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, data):
+        fname = os.path.join(self.tmpdir, 'data.csv')
+        with open(fname, 'wb') as f:
+            f.write(data)
+        return fname
+
+    def test_contents(self):
+        with mapped_file(self.write(b'a,b\n1,2\n')) as buf:
+            self.assertEqual(bytes(buf), b'a,b\n1,2\n')
+
+    def test_read_only(self):
+        with mapped_file(self.write(b'a,b\n')) as buf:
+            with self.assertRaises(TypeError):
+                buf[0:1] = b'x'
+
+    def test_empty_file(self):
+        with mapped_file(self.write(b'')) as buf:
+            self.assertEqual(len(buf), 0)
+            self.assertEqual(list(iter_csv_lines(buf)), [])
+
+    def test_view_released_on_exit(self):
+        with mapped_file(self.write(b'a,b\n')) as buf:
+            pass
+        if not hasattr(buf, 'release'):
+            raise unittest.SkipTest('python 2 buffer, nothing to release')
+        with self.assertRaises(ValueError):
+            bytes(buf)
+
+    def test_released_on_exception(self):
+        with self.assertRaises(KeyError):
+            with mapped_file(self.write(b'a,b\n')) as buf:
+                raise KeyError
+        if hasattr(buf, 'release'):
+            with self.assertRaises(ValueError):
+                bytes(buf)
+
+
+class TestIterCsvLines(unittest.TestCase):
+
+    def lines(self, data):
+        return [bytes(line) for line in iter_csv_lines(data)]
+
+    def test_newlines(self):
+        self.assertEqual(self.lines(b'a,b\n1,2\n'), [b'a,b', b'1,2'])
+
+    def test_crlf(self):
+        self.assertEqual(self.lines(b'a,b\r\n1,2\r\n'), [b'a,b', b'1,2'])
+
+    def test_no_trailing_newline(self):
+        self.assertEqual(self.lines(b'a,b\n1,2'), [b'a,b', b'1,2'])
+
+    def test_blank_lines_kept(self):
+        self.assertEqual(self.lines(b'a\n\nb\n'), [b'a', b'', b'b'])
+
+    def test_empty(self):
+        self.assertEqual(self.lines(b''), [])
+
+    def test_slices_are_views(self):
+        data = bytearray(b'a,b\n1,2\n')
+        lines = list(iter_csv_lines(data))
+        data[0:1] = b'z'
+        self.assertEqual(bytes(lines[0]), b'z,b')